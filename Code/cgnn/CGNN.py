@@ -5,20 +5,28 @@ Ref :
 Date : 09/5/17
 """
 
+import logging
 import warnings
 from copy import deepcopy
 
 import numpy as np
 import pandas as pd
 import tensorflow as tf
-from joblib import Parallel, delayed
 from pandas import DataFrame
 from sklearn.preprocessing import scale
 
 from .GNN import GNN
 from .utils.Loss import MMD_loss_tf, Fourier_MMD_Loss_tf
+from .utils.Log import configure_worker, get_logger
+from .utils.Profiler import mark, profiled, run_profile, trace_options, trace_step, write_trace
 from .utils.Settings import SETTINGS
 from .GraphModel import GraphModel
+from .utils.Dataset import as_dataset, data_matrix
+from .utils.Graph import GraphDelta, share_graph, release_graph
+from .utils.Executor import evaluate_runs
+from .utils.Scheduler import EdgeScheduler, move_orderings
+
+logger = get_logger(__name__)
 
 
 def init(size, **kwargs):
@@ -32,6 +40,38 @@ def init(size, **kwargs):
     return tf.random_normal(shape=size, stddev=init_std)
 
 
+def init_mechanism(var, par, h_layer_dim, nb_extra_inputs=0, **kwargs):
+    """ Initialize the weights of the mechanism generating var from its parents par. Pairwise mechanisms
+    (parent, var) given in kwargs are used as starting point : copied for a single parent, and averaged
+    for several parents (warm start). A random normal tensor is added so that the runs differ.
+
+    :param var: generated variable
+    :param par: list of the parents of var
+    :param h_layer_dim: Number of units in the hidden layer
+    :param nb_extra_inputs: number of inputs after the parents and the noise (e.g. confounders), randomly initialized
+    :param kwargs: mechanisms=(None) dict {(cause, effect): [W_in, b_in, W_out, b_out]} of pairwise mechanisms
+    :return: variables W_in, b_in, W_out, b_out
+    :rtype: list
+    """
+    mechanisms = kwargs.get('mechanisms') or {}
+    shapes = [[len(par) + 1 + nb_extra_inputs, h_layer_dim], [h_layer_dim], [h_layer_dim, 1], [1]]
+    known = [(k, mechanisms[(p, var)]) for k, p in enumerate(par)
+             if (p, var) in mechanisms and mechanisms[(p, var)][1].shape == (h_layer_dim,)]
+
+    if not known:
+        return [tf.Variable(init(shape, **kwargs)) for shape in shapes]
+
+    values = [np.zeros(shape, dtype='float32') for shape in shapes]
+    for k, (W_in, b_in, W_out, b_out) in known:
+        values[0][k] = W_in[0] / len(known)
+        values[0][len(par)] += W_in[1] / len(known)
+        values[1] += b_in / len(known)
+        values[2] += W_out / len(known)
+        values[3] += b_out / len(known)
+
+    return [tf.Variable(tf.constant(value) + init(shape, **kwargs)) for value, shape in zip(values, shapes)]
+
+
 class CGNN_tf(object):
     def __init__(self, N, graph, run, idx, **kwargs):
         """ Build the tensorflow graph of the CGNN structure
@@ -44,6 +84,7 @@ class CGNN_tf(object):
         :param kwargs: h_layer_dim=(SETTINGS.h_layer_dim) Number of units in the hidden layer
         :param kwargs: use_Fast_MMD=(SETTINGS.use_Fast_MMD) use fast MMD option
         :param kwargs: nb_vectors_approx_MMD=(SETTINGS.nb_vectors_approx_MMD) nb vectors
+        :param kwargs: mechanisms=(None) pairwise mechanisms initializing the mechanisms of the nodes (see init_mechanism)
         """
         learning_rate = kwargs.get('learning_rate', SETTINGS.learning_rate)
         h_layer_dim = kwargs.get('h_layer_dim', SETTINGS.h_layer_dim)
@@ -60,28 +101,21 @@ class CGNN_tf(object):
         generated_variables = {}
         theta_G = []
 
-        while len(generated_variables) < n_var:
-            # Need to generate all variables in the graph using its parents : possible because of the DAG structure
-            for var in list_nodes:
-                # Check if all parents are generated
-                par = graph.get_parents(var)
-                if (var not in generated_variables and
-                        set(par).issubset(generated_variables)):
-                    # Generate the variable
-                    W_in = tf.Variable(init([len(par) + 1, h_layer_dim], **kwargs))
-                    b_in = tf.Variable(init([h_layer_dim], **kwargs))
-                    W_out = tf.Variable(init([h_layer_dim, 1], **kwargs))
-                    b_out = tf.Variable(init([1], **kwargs))
-
-                    input_v = [generated_variables[i] for i in par]
-                    input_v.append(tf.random_normal([N, 1], mean=0, stddev=1))
-                    input_v = tf.concat(input_v, 1)
-
-                    out_v = tf.nn.relu(tf.matmul(input_v, W_in) + b_in)
-                    out_v = tf.matmul(out_v, W_out) + b_out
-
-                    generated_variables[var] = out_v
-                    theta_G.extend([W_in, b_in, W_out, b_out])
+        # Generate all variables in the graph using their parents : the topological order
+        # of the DAG places the parents of each variable before it
+        for var in graph.topological_order(list_nodes):
+            par = graph.get_parents(var)
+            W_in, b_in, W_out, b_out = init_mechanism(var, par, h_layer_dim, **kwargs)
+
+            input_v = [generated_variables[i] for i in par]
+            input_v.append(tf.random_normal([N, 1], mean=0, stddev=1))
+            input_v = tf.concat(input_v, 1)
+
+            out_v = tf.nn.relu(tf.matmul(input_v, W_in) + b_in)
+            out_v = tf.matmul(out_v, W_out) + b_out
+
+            generated_variables[var] = out_v
+            theta_G.extend([W_in, b_in, W_out, b_out])
 
         listvariablegraph = []
         for var in list_nodes:
@@ -98,11 +132,15 @@ class CGNN_tf(object):
             learning_rate=learning_rate).minimize(self.G_dist_loss_xcausesy,
                                                   var_list=theta_G))
 
+        profile = kwargs.get('profile')
+        mark(profile, 'build')
+
         config = tf.ConfigProto()
         config.gpu_options.allow_growth = True
 
         self.sess = tf.Session(config=config)
         self.sess.run(tf.global_variables_initializer())
+        mark(profile, 'session')
 
     def train(self, data, verbose=True, **kwargs):
         """ Train the initialized model
@@ -110,21 +148,31 @@ class CGNN_tf(object):
         :param data: data corresponding to the graph
         :param verbose: verbose
         :param kwargs: train_epochs=(SETTINGS.train_epochs) number of train epochs
+        :param kwargs: profile=(None) RunProfile of the run (see utils.Profiler)
         :return: None
         """
         train_epochs = kwargs.get('train_epochs', SETTINGS.train_epochs)
+        profile = kwargs.get('profile')
+        traced_step = trace_step(profile, train_epochs)
+        run_kwargs = {}
+        G_dist_loss_xcausesy_curr = None
+
         for it in range(train_epochs):
+            if it == traced_step:
+                run_kwargs = trace_options()
 
             _, G_dist_loss_xcausesy_curr = self.sess.run(
                 [self.G_solver_xcausesy, self.G_dist_loss_xcausesy],
-                feed_dict={self.all_real_variables: data}
+                feed_dict={self.all_real_variables: data}, **run_kwargs
             )
 
-            if verbose:
-                if it % 100 == 0:
-                    print('Pair:{}, Run:{}, Iter:{}, score:{}'.
-                          format(self.idx, self.run,
-                                 it, G_dist_loss_xcausesy_curr))
+            if verbose and it % 100 == 0 and logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Pair:%s, Run:%s, Iter:%s, score:%s',
+                             self.idx, self.run, it, G_dist_loss_xcausesy_curr)
+
+        if profile is not None:
+            write_trace(profile, run_kwargs)
+            profile.set_epochs('train', train_epochs, G_dist_loss_xcausesy_curr)
 
     def evaluate(self, data, verbose=True, **kwargs):
         """ Test the model
@@ -132,6 +180,7 @@ class CGNN_tf(object):
         :param data: data corresponding to the graph
         :param verbose: verbose
         :param kwargs: test_epochs=(SETTINGS.test_epochs) number of test epochs
+        :param kwargs: profile=(None) RunProfile of the run (see utils.Profiler)
         :return: mean MMD loss value of the CGNN structure on the data
         """
         test_epochs = kwargs.get('test_epochs', SETTINGS.test_epochs)
@@ -144,12 +193,13 @@ class CGNN_tf(object):
 
             sumMMD_tr += MMD_tr[0]
 
-            if verbose and it % 100 == 0:
-                print('Pair:{}, Run:{}, Iter:{}, score:{}'
-                          .format(self.idx, self.run, it, MMD_tr[0]))
+            if verbose and it % 100 == 0 and logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Pair:%s, Run:%s, Iter:%s, score:%s', self.idx, self.run, it, MMD_tr[0])
 
         tf.reset_default_graph()
 
+        if kwargs.get('profile') is not None:
+            kwargs['profile'].set_epochs('evaluate', test_epochs, sumMMD_tr / test_epochs)
         return sumMMD_tr / test_epochs
 
     def generate(self, data, **kwargs):
@@ -163,36 +213,46 @@ class CGNN_tf(object):
 def run_CGNN_tf(df_data, graph, idx=0, run=0, **kwargs):
     """ Execute the CGNN, by init, train and eval either on CPU or GPU
 
-    :param df_data: data corresponding to the graph
+    :param df_data: data corresponding to the graph (Dataset or pandas.DataFrame, see utils.Dataset)
     :param graph: Graph to be run
     :param run: number of the run (only for print)
     :param idx: number of the idx (only for print)
     :param kwargs: gpu=(SETTINGS.GPU) True if GPU is used
     :param kwargs: nb_gpu=(SETTINGS.nb_gpu) Number of available GPUs
     :param kwargs: gpu_offset=(SETTINGS.gpu_offset) number of gpu offsets
+    :param kwargs: profile_runs=(False) return a ProfiledScore with the record of the run (see utils.Profiler)
+    :param kwargs: trace_run=(None) (idx, run, file) : write the TF trace of a train step of this run to file
+    :param kwargs: log_config=(None) logging handlers of the parent process (see utils.Log.configure_worker)
     :return: MMD loss value of the given structure after training
     """
+    configure_worker(kwargs.get('log_config'))
+    profile = run_profile(idx, run, **kwargs)
+    kwargs['profile'] = profile
     gpu = kwargs.get('gpu', SETTINGS.GPU)
     nb_gpu = kwargs.get('nb_gpu', SETTINGS.NB_GPU)
     gpu_offset = kwargs.get('gpu_offset', SETTINGS.GPU_OFFSET)
 
     list_nodes = graph.get_list_nodes()
-    df_data = df_data[list_nodes].as_matrix()
-    data = df_data.astype('float32')
+    data = data_matrix(df_data, list_nodes)
 
     if (data.shape[0] > SETTINGS.max_nb_points):
         p = np.random.permutation(data.shape[0])
         data  = data[p[:int(SETTINGS.max_nb_points)],:]
+    mark(profile, 'data')
 
     if gpu:
         with tf.device('/gpu:' + str(gpu_offset + run % nb_gpu)):
             model = CGNN_tf(data.shape[0], graph, run, idx, **kwargs)
             model.train(data, **kwargs)
-            return model.evaluate(data, **kwargs)
+            mark(profile, 'train')
+            score = model.evaluate(data, **kwargs)
     else:
         model = CGNN_tf(data.shape[0], graph, run, idx, **kwargs)
         model.train(data, **kwargs)
-        return model.evaluate(data, **kwargs)
+        mark(profile, 'train')
+        score = model.evaluate(data, **kwargs)
+    mark(profile, 'evaluate')
+    return profiled(score, profile)
 
 
 def hill_climbing(graph, data, run_cgnn_function, **kwargs):
@@ -203,52 +263,77 @@ def hill_climbing(graph, data, run_cgnn_function, **kwargs):
     :param run_cgnn_function: name of the CGNN function (depending on the backend)
     :param kwargs: nb_jobs=(SETTINGS.NB_JOBS) number of jobs
     :param kwargs: nb_runs=(SETTINGS.NB_RUNS) number of runs, of different evaluations
+    :param kwargs: executor=(None) executor of the runs (see utils.Executor), joblib if None
+    :param kwargs: scheduling=(SETTINGS.scheduling) 'sweep' to re-test all edges after an improvement,
+     'dirty' to re-test only the edges in the Markov blankets of the modified edges
+    :param kwargs: move_ordering=(SETTINGS.move_ordering) order of the tested edges : 'weight' (lowest
+     pairwise weight, i.e. least confident orientation, first) or 'random'
+    :param kwargs: first_improvement=(SETTINGS.first_improvement) restart from the first edges after each improvement
+    :param kwargs: max_tries=(SETTINGS.max_tries) maximal number of evaluations per sweep (None for no limit)
+    :param kwargs: profiler=(None) Profiler collecting the timings of the runs, per candidate and per search (see utils.Profiler)
     :return: improved graph
     """
-    nb_jobs = kwargs.get("nb_jobs", SETTINGS.NB_JOBS)
-    nb_runs = kwargs.get("nb_runs", SETTINGS.NB_RUNS)
-    loop = 0
-    tested_configurations = [graph.get_dict_nw()]
-    improvement = True
-    result = []
-    result_pairs = Parallel(n_jobs=nb_jobs)(delayed(run_cgnn_function)(
-        data, graph, 0, run, **kwargs) for run in range(nb_runs))
+    scheduling = kwargs.get("scheduling", SETTINGS.scheduling)
+    move_ordering = kwargs.get("move_ordering", SETTINGS.move_ordering)
+    first_improvement = kwargs.get("first_improvement", SETTINGS.first_improvement)
+    max_tries = kwargs.get("max_tries", SETTINGS.max_tries)
+    tested_configurations = {graph.fingerprint()}
+    result_pairs = evaluate_runs(run_cgnn_function, data, graph, 0, **kwargs)
 
     score_network = np.mean([i for i in result_pairs if np.isfinite(i)])
     globalscore = score_network
 
-    print("Graph score : " + str(globalscore))
-
-    while improvement:
-        loop += 1
-        improvement = False
-        list_edges = graph.get_list_edges()
-        for idx_pair in range(len(list_edges)):
-            edge = list_edges[idx_pair]
-            test_graph = deepcopy(graph)
-            test_graph.reverse_edge(edge[0], edge[1])
-
-            if (test_graph.is_cyclic()
-                or test_graph.get_dict_nw() in tested_configurations):
-                print('No Evaluation for {}'.format([edge]))
+    logger.info('Graph score : %s', globalscore)
+
+    # Workers load the current graph once and then only receive the moves
+    graph_key = share_graph(graph)
+    try:
+        scheduler = EdgeScheduler(graph, dirty_only=(scheduling == 'dirty'),
+                                  priority=move_orderings[move_ordering],
+                                  first_improvement=first_improvement, max_tries=max_tries)
+        nb_evaluations = 0
+        idx_pair = 0
+        edge = scheduler.pop()
+
+        while edge is not None:
+            idx_pair += 1
+            if graph.would_create_cycle(edge[1], edge[0]):
+                logger.debug('No Evaluation for %s', [edge])
+                edge = scheduler.pop()
+                continue
+            test_graph = GraphDelta(graph, [('reverse', edge[0], edge[1])], graph_key)
+
+            if test_graph.fingerprint() in tested_configurations:
+                logger.debug('No Evaluation for %s', [edge])
             else:
-                print('Edge {} in evaluation :'.format(edge))
-                tested_configurations.append(test_graph.get_dict_nw())
-                result_pairs = Parallel(n_jobs=nb_jobs)(delayed(run_cgnn_function)(
-                    data, test_graph, idx_pair, run, **kwargs) for run in range(nb_runs))
+                logger.debug('Edge %s in evaluation :', edge)
+                tested_configurations.add(test_graph.fingerprint())
+                scheduler.tried()
+                nb_evaluations += 1
+                result_pairs = evaluate_runs(run_cgnn_function, data, test_graph, idx_pair, **kwargs)
 
                 score_network = np.mean([i for i in result_pairs if np.isfinite(i)])
 
-                print("Current score : " + str(score_network))
-                print("Best score : " + str(globalscore))
+                logger.debug('Current score : %s', score_network)
+                logger.debug('Best score : %s', globalscore)
 
                 if score_network < globalscore:
                     graph.reverse_edge(edge[0], edge[1])
-                    improvement = True
-                    print('Edge {} got reversed !'.format(edge))
+                    release_graph(graph_key)
+                    graph_key = share_graph(graph)
+                    scheduler.accept(edge[:2])
+                    logger.info('Edge %s got reversed !', edge)
                     globalscore = score_network
 
+            edge = scheduler.pop()
+
+        logger.info("Number of sweeps : %s, considered edges : %s, evaluations : %s",
+                    scheduler.nb_sweeps, idx_pair, nb_evaluations)
+    finally:
+        release_graph(graph_key)
 
+    if kwargs.get("profiler") is not None:
+        kwargs["profiler"].end_search('hill_climbing')
     return graph
 
 
@@ -260,24 +345,22 @@ def exploratory_hill_climbing(graph, data, run_cgnn_function, **kwargs):
     :param run_cgnn_function: name of the CGNN function (depending on the backend)
     :param kwargs: nb_jobs=(SETTINGS.NB_JOBS) number of jobs
     :param kwargs: nb_runs=(SETTINGS.NB_RUNS) number of runs, of different evaluations
+    :param kwargs: profiler=(None) Profiler collecting the timings of the runs, per candidate and per search (see utils.Profiler)
     :return: improved graph
     """
-    nb_jobs = kwargs.get("nb_jobs", SETTINGS.NB_JOBS)
-    nb_runs = kwargs.get("nb_runs", SETTINGS.NB_RUNS)
 
     nb_loops = 150
     exploration_factor = 10  # Average of number of edges to reverse at the beginning.
     assert exploration_factor < len(graph.get_list_edges())
 
     loop = 0
-    tested_configurations = [graph.get_dict_nw()]
-    result_pairs = Parallel(n_jobs=nb_jobs)(delayed(run_cgnn_function)(
-        data, graph, 0, run, **kwargs) for run in range(nb_runs))
+    tested_configurations = {graph.fingerprint()}
+    result_pairs = evaluate_runs(run_cgnn_function, data, graph, 0, **kwargs)
 
     score_network = np.mean([i for i in result_pairs if np.isfinite(i)])
     globalscore = score_network
 
-    print("Graph score : " + str(globalscore))
+    logger.info('Graph score : %s', globalscore)
 
     while loop < nb_loops:
         loop += 1
@@ -291,24 +374,25 @@ def exploratory_hill_climbing(graph, data, run_cgnn_function, **kwargs):
             for edge in list_edges[selected_edges]:
                 test_graph.reverse_edge()
             if not (test_graph.is_cyclic()
-                    or test_graph.get_dict_nw() in tested_configurations):
+                    or test_graph.fingerprint() in tested_configurations):
                 possible_solution = True
 
-            print('Reversed Edges {} in evaluation :'.format(list_edges[selected_edges]))
-            tested_configurations.append(test_graph.get_dict_nw())
-            result_pairs = Parallel(n_jobs=nb_jobs)(delayed(run_cgnn_function)(
-                data, test_graph, loop, run, **kwargs) for run in range(nb_runs))
+            logger.debug('Reversed Edges %s in evaluation :', list_edges[selected_edges])
+            tested_configurations.add(test_graph.fingerprint())
+            result_pairs = evaluate_runs(run_cgnn_function, data, test_graph, loop, **kwargs)
 
             score_network = np.mean([i for i in result_pairs if np.isfinite(i)])
 
-            print("Current score : " + str(score_network))
-            print("Best score : " + str(globalscore))
+            logger.debug('Current score : %s', score_network)
+            logger.debug('Best score : %s', globalscore)
 
             if score_network < globalscore:
                 graph.reverse_edge(edge[0], edge[1])
-                print('Edge {} got reversed !'.format(list_edges[selected_edges]))
+                logger.info('Edge %s got reversed !', list_edges[selected_edges])
                 globalscore = score_network
 
+    if kwargs.get("profiler") is not None:
+        kwargs["profiler"].end_search('exploratory_hill_climbing')
     return graph
 
 
@@ -346,36 +430,51 @@ class CGNN(GraphModel):
         elif self.backend == 'PyTorch':
             self.infer_graph = run_CGNN_th
         else:
-            print('No backend known as {}'.format(self.backend))
-            raise ValueError
+            raise ValueError('No backend known as {}'.format(self.backend))
 
     def create_graph_from_data(self, data):
-        print("The CGNN model is not able (yet?) to model the graph directly from raw data")
-        raise ValueError
+        raise ValueError("The CGNN model is not able (yet?) to model the graph directly from raw data")
 
     def orient_directed_graph(self, data, dag, alg='HC', **kwargs):
         """ Improve a directed acyclic graph using CGNN
 
-        :param data: data
+        :param data: data (Dataset or pandas.DataFrame, see utils.Dataset and utils.Formats.read_numdata)
         :param dag: directed acyclic graph to optimize
         :param alg: type of algorithm
         :param log: Save logs of the execution
         :return: improved directed acyclic graph
         """
-        data = DataFrame(scale(data.as_matrix()), columns=data.columns)
+        # Standardized once ; the workers only receive the name of the shared file
+        dataset = as_dataset(data)
+        shared = dataset.filename is None
+        dataset.share()
         alg_dic = {'HC': hill_climbing, 'tabu': tabu_search, 'EHC': exploratory_hill_climbing}
-        return alg_dic[alg](dag, data, self.infer_graph, **kwargs)
+        try:
+            return alg_dic[alg](dag, dataset, self.infer_graph, **kwargs)
+        finally:
+            if shared:
+                dataset.release()
 
     def orient_undirected_graph(self, data, umg, **kwargs):
         """ Orient the undirected graph using GNN and apply CGNN to improve the graph
 
         :param data: data
         :param umg: undirected acyclic graph
+        :param kwargs: init_mechanisms=(SETTINGS.init_mechanisms) initialize the mechanisms of CGNN
+         with the mechanisms trained by GNN ; not available with batched_pairwise and scheduled_pairwise
         :return: directed acyclic graph
         """
 
         warnings.warn("The pairwise GNN model is computed on each edge of the UMG "
                       "to initialize the model and start CGNN with a DAG")
-        gnn = GNN(backend=self.backend, **kwargs)
-        dag = gnn.orient_graph(data, umg, **kwargs)  # Pairwise method
+        init_mechanisms = kwargs.get('init_mechanisms', SETTINGS.init_mechanisms)
+        data = as_dataset(data)  # Standardized once for GNN and CGNN
+        gnn = GNN(backend=self.backend)
+        if init_mechanisms:
+            dag = gnn.orient_graph(data, umg, **dict(kwargs, keep_mechanisms=True))  # Pairwise method
+            kwargs['mechanisms'] = gnn.edge_mechanisms
+        else:
+            dag = gnn.orient_graph(data, umg, **kwargs)  # Pairwise method
+        if kwargs.get("profiler") is not None:
+            kwargs["profiler"].end_search('pairwise')
         return self.orient_directed_graph(data, dag, **kwargs)
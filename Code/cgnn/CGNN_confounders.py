@@ -5,22 +5,30 @@ Ref :
 Date : 09/5/17
 """
 
+import logging
 import warnings
 from copy import deepcopy
 
 import numpy as np
 import tensorflow as tf
-from joblib import Parallel, delayed
 # import torch as th
 # from torch.autograd import Variable
 from pandas import DataFrame
 from sklearn.preprocessing import scale
 
+from .CGNN import init_mechanism
 from .GNN import GNN
 from .utils.Loss import MMD_loss_tf, Fourier_MMD_Loss_tf
 # from ...utils.Loss import  MMD_loss_th
+from .utils.Log import configure_worker, get_logger
+from .utils.Profiler import mark, profiled, run_profile, trace_options, trace_step, write_trace
 from .utils.Settings import SETTINGS
 from .GraphModel import GraphModel
+from .utils.Dataset import as_dataset, data_matrix
+from .utils.Graph import GraphDelta, share_graph, release_graph
+from .utils.Executor import evaluate_runs
+
+logger = get_logger(__name__)
 
 
 def init(size, **kwargs):
@@ -46,6 +54,7 @@ class CGNN_confounders_tf(object):
         :param kwargs: h_layer_dim=(SETTINGS.h_layer_dim) Number of units in the hidden layer
         :param kwargs: use_Fast_MMD=(SETTINGS.use_Fast_MMD) use fast MMD option
         :param kwargs: nb_vectors_approx_MMD=(SETTINGS.nb_vectors_approx_MMD) nb vectors
+        :param kwargs: mechanisms=(None) pairwise mechanisms initializing the mechanisms of the nodes (see CGNN.init_mechanism)
         """
         learning_rate = kwargs.get('learning_rate', SETTINGS.learning_rate)
         h_layer_dim = kwargs.get('h_layer_dim', SETTINGS.h_layer_dim)
@@ -71,35 +80,28 @@ class CGNN_confounders_tf(object):
             confounder_variables[edge[0],edge[1]] = noise_variable
             confounder_variables[edge[1],edge[0]] = noise_variable
 
-        while len(generated_variables) < n_var:
-            # Need to generate all variables in the graph using its parents : possible because of the DAG structure
-            for var in list_nodes:
-                # Check if all parents are generated
-                par = graph.get_parents(var)
-                if (var not in generated_variables and set(par).issubset(generated_variables)):
-
-                    neighboorhood = graph.skeleton.get_neighbors(var)
-
-                    # Generate the variable
-                    W_in = tf.Variable(init([len(par) + len(neighboorhood) + 1, h_layer_dim], **kwargs))
-                    b_in = tf.Variable(init([h_layer_dim], **kwargs))
-                    W_out = tf.Variable(init([h_layer_dim, 1], **kwargs))
-                    b_out = tf.Variable(init([1], **kwargs))
+        # Generate all variables in the graph using their parents : the topological order
+        # of the DAG places the parents of each variable before it
+        for var in graph.topological_order(list_nodes):
+            par = graph.get_parents(var)
+            neighboorhood = graph.skeleton.get_neighbors(var)
 
-                    input_v = [generated_variables[i] for i in par]
-                    input_v.append(tf.random_normal([N, 1], mean=0, stddev=1))
+            # Generate the variable
+            W_in, b_in, W_out, b_out = init_mechanism(var, par, h_layer_dim, len(neighboorhood), **kwargs)
 
+            input_v = [generated_variables[i] for i in par]
+            input_v.append(tf.random_normal([N, 1], mean=0, stddev=1))
 
-                    for i in neighboorhood:
-                        input_v.append(confounder_variables[i,var])
+            for i in neighboorhood:
+                input_v.append(confounder_variables[i,var])
 
-                    input_v = tf.concat(input_v, 1)
+            input_v = tf.concat(input_v, 1)
 
-                    out_v = tf.nn.relu(tf.matmul(input_v, W_in) + b_in)
-                    out_v = tf.matmul(out_v, W_out) + b_out
+            out_v = tf.nn.relu(tf.matmul(input_v, W_in) + b_in)
+            out_v = tf.matmul(out_v, W_out) + b_out
 
-                    generated_variables[var] = out_v
-                    theta_G.extend([W_in, b_in, W_out, b_out])
+            generated_variables[var] = out_v
+            theta_G.extend([W_in, b_in, W_out, b_out])
 
 
         listvariablegraph = []
@@ -117,11 +119,15 @@ class CGNN_confounders_tf(object):
             learning_rate=learning_rate).minimize(self.G_dist_loss_xcausesy,
                                                   var_list=theta_G))
 
+        profile = kwargs.get('profile')
+        mark(profile, 'build')
+
         config = tf.ConfigProto()
         config.gpu_options.allow_growth = True
 
         self.sess = tf.Session(config=config)
         self.sess.run(tf.global_variables_initializer())
+        mark(profile, 'session')
 
     def train(self, data, verbose=True, **kwargs):
         """ Train the initialized model
@@ -129,21 +135,31 @@ class CGNN_confounders_tf(object):
         :param data: data corresponding to the graph
         :param verbose: verbose
         :param kwargs: train_epochs=(SETTINGS.train_epochs) number of train epochs
+        :param kwargs: profile=(None) RunProfile of the run (see utils.Profiler)
         :return: None
         """
         train_epochs = kwargs.get('train_epochs', SETTINGS.train_epochs)
+        profile = kwargs.get('profile')
+        traced_step = trace_step(profile, train_epochs)
+        run_kwargs = {}
+        G_dist_loss_xcausesy_curr = None
+
         for it in range(train_epochs):
+            if it == traced_step:
+                run_kwargs = trace_options()
 
             _, G_dist_loss_xcausesy_curr = self.sess.run(
                 [self.G_solver_xcausesy, self.G_dist_loss_xcausesy],
-                feed_dict={self.all_real_variables: data}
+                feed_dict={self.all_real_variables: data}, **run_kwargs
             )
 
-            if verbose:
-                if it % 500 == 0:
-                    print('Pair:{}, Run:{}, Iter:{}, score:{}'.
-                          format(self.idx, self.run,
-                                 it, G_dist_loss_xcausesy_curr))
+            if verbose and it % 500 == 0 and logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Pair:%s, Run:%s, Iter:%s, score:%s',
+                             self.idx, self.run, it, G_dist_loss_xcausesy_curr)
+
+        if profile is not None:
+            write_trace(profile, run_kwargs)
+            profile.set_epochs('train', train_epochs, G_dist_loss_xcausesy_curr)
 
     def evaluate(self, data, verbose=True, **kwargs):
         """ Test the model
@@ -151,6 +167,7 @@ class CGNN_confounders_tf(object):
         :param data: data corresponding to the graph
         :param verbose: verbose
         :param kwargs: test_epochs=(SETTINGS.test_epochs) number of test epochs
+        :param kwargs: profile=(None) RunProfile of the run (see utils.Profiler)
         :return: mean MMD loss value of the CGNN structure on the data
         """
         test_epochs = kwargs.get('test_epochs', SETTINGS.test_epochs)
@@ -163,12 +180,13 @@ class CGNN_confounders_tf(object):
 
             sumMMD_tr += MMD_tr[0]
 
-            if verbose and it % 500 == 0:
-                print('Pair:{}, Run:{}, Iter:{}, score:{}'
-                          .format(self.idx, self.run, it, MMD_tr[0]))
+            if verbose and it % 500 == 0 and logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Pair:%s, Run:%s, Iter:%s, score:%s', self.idx, self.run, it, MMD_tr[0])
 
         tf.reset_default_graph()
 
+        if kwargs.get('profile') is not None:
+            kwargs['profile'].set_epochs('evaluate', test_epochs, sumMMD_tr / test_epochs)
         return sumMMD_tr / test_epochs
 
     def generate(self, data, **kwargs):
@@ -182,38 +200,46 @@ class CGNN_confounders_tf(object):
 def run_CGNN_confounders_tf(df_data, graph, idx=0, run=0, **kwargs):
     """ Execute the CGNN, by init, train and eval either on CPU or GPU
 
-    :param df_data: data corresponding to the graph
+    :param df_data: data corresponding to the graph (Dataset or pandas.DataFrame, see utils.Dataset)
     :param graph: Graph to be run
     :param run: number of the run (only for print)
     :param idx: number of the idx (only for print)
     :param kwargs: gpu=(SETTINGS.GPU) True if GPU is used
     :param kwargs: nb_gpu=(SETTINGS.nb_gpu) Number of available GPUs
     :param kwargs: gpu_offset=(SETTINGS.gpu_offset) number of gpu offsets
+    :param kwargs: profile_runs=(False) return a ProfiledScore with the record of the run (see utils.Profiler)
+    :param kwargs: trace_run=(None) (idx, run, file) : write the TF trace of a train step of this run to file
+    :param kwargs: log_config=(None) logging handlers of the parent process (see utils.Log.configure_worker)
     :return: MMD loss value of the given structure after training
     """
+    configure_worker(kwargs.get('log_config'))
+    profile = run_profile(idx, run, **kwargs)
+    kwargs['profile'] = profile
     gpu = kwargs.get('gpu', SETTINGS.GPU)
     nb_gpu = kwargs.get('nb_gpu', SETTINGS.NB_GPU)
     gpu_offset = kwargs.get('gpu_offset', SETTINGS.GPU_OFFSET)
 
     list_nodes = graph.skeleton.get_list_nodes()
-
-    df_data = df_data[list_nodes].as_matrix()
-
-    data = df_data.astype('float32')
+    data = data_matrix(df_data, list_nodes)
 
     if (data.shape[0] > SETTINGS.max_nb_points):
         p = np.random.permutation(data .shape[0])
         data  = data[p[:int(SETTINGS.max_nb_points)],:]
+    mark(profile, 'data')
 
     if gpu:
         with tf.device('/gpu:' + str(gpu_offset + run % nb_gpu)):
             model = CGNN_confounders_tf(data.shape[0], graph, run, idx, **kwargs)
             model.train(data, **kwargs)
-            return model.evaluate(data, **kwargs)
+            mark(profile, 'train')
+            score = model.evaluate(data, **kwargs)
     else:
-        model = CGNN_confounders_tf(data, graph, run, idx, **kwargs)
+        model = CGNN_confounders_tf(data.shape[0], graph, run, idx, **kwargs)
         model.train(data, **kwargs)
-        return model.evaluate(data, **kwargs)
+        mark(profile, 'train')
+        score = model.evaluate(data, **kwargs)
+    mark(profile, 'evaluate')
+    return profiled(score, profile)
 
 
 def hill_climbing_confounders(graph, data, run_cgnn_function, **kwargs):
@@ -224,162 +250,179 @@ def hill_climbing_confounders(graph, data, run_cgnn_function, **kwargs):
     :param run_cgnn_function: name of the CGNN function (depending on the backend)
     :param kwargs: nb_jobs=(SETTINGS.NB_JOBS) number of jobs
     :param kwargs: nb_runs=(SETTINGS.NB_RUNS) number of runs, of different evaluations
+    :param kwargs: executor=(None) executor of the runs (see utils.Executor), joblib if None
+    :param kwargs: profiler=(None) Profiler collecting the timings of the runs, per candidate and per search (see utils.Profiler)
     :return: improved graph
     """
-    nb_jobs = kwargs.get("nb_jobs", SETTINGS.NB_JOBS)
-    nb_runs = kwargs.get("nb_runs", SETTINGS.NB_RUNS)
     loop = 0
-    tested_configurations = [graph.get_dict_nw()]
+    tested_configurations = {graph.fingerprint()}
     improvement = True
-    result_pairs = Parallel(n_jobs=nb_jobs)(delayed(run_cgnn_function)(data, graph, 0, run, **kwargs) for run in range(nb_runs))
+    result_pairs = evaluate_runs(run_cgnn_function, data, graph, 0, **kwargs)
 
     score_network = np.mean([i for i in result_pairs if np.isfinite(i)])
     score_network += SETTINGS.complexity_graph_param*len(graph.get_list_edges())
     globalscore = score_network
 
-    while improvement:
+    # Workers load the current graph once and then only receive the moves
+    graph_key = share_graph(graph)
+    try:
+        while improvement:
 
-        loop += 1
-        improvement = False
-        list_edges_to_evaluate = graph.skeleton.get_list_edges_without_duplicate()
+            loop += 1
+            improvement = False
+            list_edges_to_evaluate = graph.skeleton.get_list_edges_without_duplicate()
 
-        for idx_pair in range(0,len(list_edges_to_evaluate)):
+            for idx_pair in range(0,len(list_edges_to_evaluate)):
 
-            edge = list_edges_to_evaluate[idx_pair]
+                edge = list_edges_to_evaluate[idx_pair]
 
-            print(edge)
-            print(graph.get_list_edges(return_weights=False))
-            ### If edge already oriented in the graph
-            if([edge[0], edge[1]] in graph.get_list_edges(return_weights=False) or [edge[1], edge[0]] in graph.get_list_edges(return_weights=False)):
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug('Edge %s of the graph %s', edge, graph.get_list_edges(return_weights=False))
+                ### If edge already oriented in the graph
+                if([edge[0], edge[1]] in graph.get_list_edges(return_weights=False) or [edge[1], edge[0]] in graph.get_list_edges(return_weights=False)):
 
-                if([edge[0], edge[1]] in graph.get_list_edges(return_weights=False)):
-                    node1 = edge[0]
-                    node2 = edge[1]
-                else:
-                    node2 = edge[0]
-                    node1 = edge[1]
+                    if([edge[0], edge[1]] in graph.get_list_edges(return_weights=False)):
+                        node1 = edge[0]
+                        node2 = edge[1]
+                    else:
+                        node2 = edge[0]
+                        node1 = edge[1]
 
-                #### Test reverse edge
-                test_graph = deepcopy(graph)
-                test_graph.reverse_edge(node1, node2)
+                    #### Test reverse edge
+                    if graph.would_create_cycle(node2, node1):
+                        test_graph = None
+                    else:
+                        test_graph = GraphDelta(graph, [('reverse', node1, node2)], graph_key)
 
-                if (test_graph.is_cyclic()
-                    or test_graph.get_dict_nw() in tested_configurations):
-                    print("No evaluation for edge " + str(node1) + " -> " + str(node2))
-                else:
-                    print("Reverse Edge " + str(node1) + " -> " + str(node2) + " in evaluation")
-                    tested_configurations.append(test_graph.get_dict_nw())
-                    result_pairs = Parallel(n_jobs=nb_jobs)(delayed(run_cgnn_function)(data, test_graph, idx_pair, run, **kwargs) for run in range(nb_runs))
+                    if (test_graph is None
+                        or test_graph.fingerprint() in tested_configurations):
+                        logger.debug('No evaluation for edge %s -> %s', node1, node2)
+                    else:
+                        logger.debug('Reverse Edge %s -> %s in evaluation', node1, node2)
+                        tested_configurations.add(test_graph.fingerprint())
+                        result_pairs = evaluate_runs(run_cgnn_function, data, test_graph, idx_pair, **kwargs)
+
+                        score_network = np.mean([i for i in result_pairs if np.isfinite(i)])
+                        score_network += SETTINGS.complexity_graph_param * len(test_graph.get_list_edges())
+
+                        logger.debug('Current score : %s', score_network)
+                        logger.debug('Best score : %s', globalscore)
+
+                        if score_network < globalscore:
+                            graph.reverse_edge(node1, node2)
+                            release_graph(graph_key)
+                            graph_key = share_graph(graph)
+                            improvement = True
+                            logger.info('Edge %s->%s got reversed !', node1, node2)
+                            globalscore = score_network
+                            node = node1
+                            node1 = node2
+                            node2 = node
+
+                    #### Test suppression
+                    test_graph = GraphDelta(graph, [('remove', node1, node2)], graph_key)
+
+                    if (test_graph.fingerprint() in tested_configurations):
+                        logger.debug('Removing already evaluated for edge %s -> %s', node1, node2)
+                    else:
+                        logger.debug('Removing edge %s -> %s in evaluation', node1, node2)
 
-                    score_network = np.mean([i for i in result_pairs if np.isfinite(i)])
-                    score_network += SETTINGS.complexity_graph_param * len(test_graph.get_list_edges())
+                        tested_configurations.add(test_graph.fingerprint())
+                        result_pairs = evaluate_runs(run_cgnn_function, data, test_graph, idx_pair, **kwargs)
 
-                    print("Current score : " + str(score_network))
-                    print("Best score : " + str(globalscore))
+                        score_network = np.mean([i for i in result_pairs if np.isfinite(i)])
+                        score_network += SETTINGS.complexity_graph_param * len(test_graph.get_list_edges())
 
-                    if score_network < globalscore:
-                        graph.reverse_edge(node1, node2)
-                        improvement = True
-                        print("Edge " + str(node1) + "->" + str(node2) + " got reversed !")
-                        globalscore = score_network
-                        node = node1
-                        node1 = node2
-                        node2 = node
-
-                #### Test suppression
-                test_graph = deepcopy(graph)
-                test_graph.remove_edge(node1, node2)
-
-                if (test_graph.get_dict_nw() in tested_configurations):
-                    print("Removing already evaluated for edge " + str(node1) + " -> " + str(node2))
-                else:
-                    print("Removing edge " + str(node1) + " -> " + str(node2) + " in evaluation")
+                        logger.debug('Current score : %s', score_network)
+                        logger.debug('Best score : %s', globalscore)
 
-                    tested_configurations.append(test_graph.get_dict_nw())
-                    result_pairs = Parallel(n_jobs=nb_jobs)(delayed(run_cgnn_function)(
-                        data, test_graph, idx_pair, run, **kwargs) for run in range(nb_runs))
+                        if score_network < globalscore:
+                            graph.remove_edge(node1, node2)
+                            release_graph(graph_key)
+                            graph_key = share_graph(graph)
+                            improvement = True
+                            logger.info('Edge %s -> %s got removed, possible confounder !', node1, node2)
+                            globalscore = score_network
 
-                    score_network = np.mean([i for i in result_pairs if np.isfinite(i)])
-                    score_network += SETTINGS.complexity_graph_param * len(test_graph.get_list_edges())
+                        else:
+                            #We keep the edge and its score is set to (score_network - globalscore)
+                            logger.info('Edge %s -> %s not removed. Score edge : %s', node1, node2, score_network - globalscore)
+                            graph.set_weight(node1, node2, score_network - globalscore)
 
-                    print("Current score : " + str(score_network))
-                    print("Best score : " + str(globalscore))
 
-                    if score_network < globalscore:
-                        graph.remove_edge(node1, node2)
-                        improvement = True
-                        print("Edge " + str(node1) + " -> " + str(node2) + " got removed, possible confounder !")
-                        globalscore = score_network
+                ### Eval if a suppressed edge need to be restored
+                else:
 
-                    else:
-                        #We keep the edge and its score is set to (score_network - globalscore)
-                        print("Edge " + str(node1) + " -> " + str(node2) + " not removed. Score edge : " + str(score_network - globalscore))
-                        graph.set_weight(node1, node2, score_network - globalscore)
+                    node1 = edge[0]
+                    node2 = edge[1]
 
+                    #### Test add edge sens node1 -> node2
+                    score_network_add_edge_node1_node2 = 9999
 
-            ### Eval if a suppressed edge need to be restored
-            else:
+                    if graph.would_create_cycle(node1, node2):
+                        test_graph = None
+                    else:
+                        test_graph = GraphDelta(graph, [('add', node1, node2)], graph_key)
 
-                node1 = edge[0]
-                node2 = edge[1]
+                    if (test_graph is None
+                        or test_graph.fingerprint() in tested_configurations):
+                        logger.debug('No addition possible for %s -> %s', node1, node2)
+                    else:
+                        logger.debug('Addition of edge %s -> %s in evaluation :', node1, node2)
+                        tested_configurations.add(test_graph.fingerprint())
+                        result_pairs = evaluate_runs(run_cgnn_function, data, test_graph, idx_pair, **kwargs)
 
-                #### Test add edge sens node1 -> node2
-                test_graph = deepcopy(graph)
-                test_graph.add(node1, node2)
+                        score_network_add_edge_node1_node2 = np.mean([i for i in result_pairs if np.isfinite(i)])
+                        score_network_add_edge_node1_node2 += SETTINGS.complexity_graph_param * len(test_graph.get_list_edges())
 
-                score_network_add_edge_node1_node2 = 9999
+                        logger.debug('score network add edge %s -> %s : %s', node1, node2, score_network_add_edge_node1_node2)
 
-                if (test_graph.is_cyclic()
-                    or test_graph.get_dict_nw() in tested_configurations):
-                    print("No addition possible for " + str(node1) + " -> " + str(node2))
-                else:
-                    print("Addition of edge " + str(node1) + " -> " + str(node2) + " in evaluation :")
-                    tested_configurations.append(test_graph.get_dict_nw())
-                    result_pairs = Parallel(n_jobs=nb_jobs)(delayed(run_cgnn_function)(
-                        data, test_graph, idx_pair, run, **kwargs) for run in range(nb_runs))
+                    #### Test add edge sens node2 -> node1
+                    score_network_add_edge_node2_node1 = 9999
 
-                    score_network_add_edge_node1_node2 = np.mean([i for i in result_pairs if np.isfinite(i)])
-                    score_network_add_edge_node1_node2 += SETTINGS.complexity_graph_param * len(test_graph.get_list_edges())
+                    if graph.would_create_cycle(node2, node1):
+                        test_graph = None
+                    else:
+                        test_graph = GraphDelta(graph, [('add', node2, node1)], graph_key)
 
-                    print("score network add edge " + str(node1) + " -> " + str(node2) + " : " + str(score_network_add_edge_node1_node2))
+                    if (test_graph is None
+                        or test_graph.fingerprint() in tested_configurations):
+                        logger.debug('No addition possible for edge %s -> %s', node2, node1)
+                    else:
+                        logger.debug('Addition of edge %s -> %s in evaluation :', node2, node1)
+                        tested_configurations.add(test_graph.fingerprint())
+                        result_pairs = evaluate_runs(run_cgnn_function, data, test_graph, idx_pair, **kwargs)
 
-                #### Test add edge sens node2 -> node1
-                test_graph = deepcopy(graph)
-                test_graph.add(node2, node1)
+                        score_network_add_edge_node2_node1 = np.mean([i for i in result_pairs if np.isfinite(i)])
+                        score_network_add_edge_node2_node1 += SETTINGS.complexity_graph_param * len(test_graph.get_list_edges())
 
-                score_network_add_edge_node2_node1 = 9999
+                        logger.debug('score network add edge %s -> %s : %s', node2, node1, score_network_add_edge_node2_node1)
 
-                if (test_graph.is_cyclic()
-                    or test_graph.get_dict_nw() in tested_configurations):
-                    print("No addition possible for edge " + str(node2) + " -> " + str(node1))
-                else:
-                    print("Addition of edge " + str(node2) + " -> " + str(node1) + " in evaluation :")
-                    tested_configurations.append(test_graph.get_dict_nw())
-                    result_pairs = Parallel(n_jobs=nb_jobs)(delayed(run_cgnn_function)(
-                        data, test_graph, idx_pair, run, **kwargs) for run in range(nb_runs))
-
-                    score_network_add_edge_node2_node1 = np.mean([i for i in result_pairs if np.isfinite(i)])
-                    score_network_add_edge_node2_node1 += SETTINGS.complexity_graph_param * len(test_graph.get_list_edges())
-
-                    print("score network add edge " + str(node2) + " -> " + str(node1) + " : " + str(score_network_add_edge_node2_node1))
-
-                print("Best score : " + str(globalscore))
-
-                if score_network_add_edge_node1_node2 < globalscore and score_network_add_edge_node1_node2 < score_network_add_edge_node2_node1:
-                    score_edge = globalscore - score_network_add_edge_node1_node2
-                    graph.add(node1, node2, score_edge)
-                    improvement = True
-                    print("Edge " + str(node1) + " -> " + str(node2) + " is added with score : " + str(score_edge) + " !")
-                    globalscore = score_network_add_edge_node1_node2
-                elif score_network_add_edge_node2_node1 < globalscore and score_network_add_edge_node2_node1 < score_network_add_edge_node1_node2:
-                    score_edge = globalscore - score_network_add_edge_node2_node1
-                    graph.add(node2, node1, score_edge)
-                    improvement = True
-                    print("Edge " + str(node2) + " -> " + str(node1) + " is added with score : " + str(score_edge) + " !")
-                    globalscore = score_network_add_edge_node2_node1
-                else :
-                    print("Edge not added, possible confounder " + str(node1) + " <-> " + str(node2))
+                    logger.debug('Best score : %s', globalscore)
 
+                    if score_network_add_edge_node1_node2 < globalscore and score_network_add_edge_node1_node2 < score_network_add_edge_node2_node1:
+                        score_edge = globalscore - score_network_add_edge_node1_node2
+                        graph.add(node1, node2, score_edge)
+                        release_graph(graph_key)
+                        graph_key = share_graph(graph)
+                        improvement = True
+                        logger.info('Edge %s -> %s is added with score : %s !', node1, node2, score_edge)
+                        globalscore = score_network_add_edge_node1_node2
+                    elif score_network_add_edge_node2_node1 < globalscore and score_network_add_edge_node2_node1 < score_network_add_edge_node1_node2:
+                        score_edge = globalscore - score_network_add_edge_node2_node1
+                        graph.add(node2, node1, score_edge)
+                        release_graph(graph_key)
+                        graph_key = share_graph(graph)
+                        improvement = True
+                        logger.info('Edge %s -> %s is added with score : %s !', node2, node1, score_edge)
+                        globalscore = score_network_add_edge_node2_node1
+                    else :
+                        logger.info('Edge not added, possible confounder %s <-> %s', node1, node2)
+    finally:
+        release_graph(graph_key)
+
+    if kwargs.get("profiler") is not None:
+        kwargs["profiler"].end_search('hill_climbing_confounders')
     return graph
 
 
@@ -391,24 +434,22 @@ def exploratory_hill_climbing(graph, data, run_cgnn_function, **kwargs):
     :param run_cgnn_function: name of the CGNN function (depending on the backend)
     :param kwargs: nb_jobs=(SETTINGS.NB_JOBS) number of jobs
     :param kwargs: nb_runs=(SETTINGS.NB_RUNS) number of runs, of different evaluations
+    :param kwargs: profiler=(None) Profiler collecting the timings of the runs, per candidate and per search (see utils.Profiler)
     :return: improved graph
     """
-    nb_jobs = kwargs.get("nb_jobs", SETTINGS.NB_JOBS)
-    nb_runs = kwargs.get("nb_runs", SETTINGS.NB_RUNS)
 
     nb_loops = 150
     exploration_factor = 10  # Average of number of edges to reverse at the beginning.
     assert exploration_factor < len(graph.get_list_edges())
 
     loop = 0
-    tested_configurations = [graph.get_dict_nw()]
-    result_pairs = Parallel(n_jobs=nb_jobs)(delayed(run_cgnn_function)(
-        data, graph, 0, run, **kwargs) for run in range(nb_runs))
+    tested_configurations = {graph.fingerprint()}
+    result_pairs = evaluate_runs(run_cgnn_function, data, graph, 0, **kwargs)
 
     score_network = np.mean([i for i in result_pairs if np.isfinite(i)])
     globalscore = score_network
 
-    print("Graph score : " + str(globalscore))
+    logger.info('Graph score : %s', globalscore)
 
     while loop < nb_loops:
         loop += 1
@@ -422,24 +463,25 @@ def exploratory_hill_climbing(graph, data, run_cgnn_function, **kwargs):
             for edge in list_edges[selected_edges]:
                 test_graph.reverse_edge()
             if not (test_graph.is_cyclic()
-                    or test_graph.get_dict_nw() in tested_configurations):
+                    or test_graph.fingerprint() in tested_configurations):
                 possible_solution = True
 
-            print('Reversed Edges {} in evaluation :'.format(list_edges[selected_edges]))
-            tested_configurations.append(test_graph.get_dict_nw())
-            result_pairs = Parallel(n_jobs=nb_jobs)(delayed(run_cgnn_function)(
-                data, test_graph, loop, run, **kwargs) for run in range(nb_runs))
+            logger.debug('Reversed Edges %s in evaluation :', list_edges[selected_edges])
+            tested_configurations.add(test_graph.fingerprint())
+            result_pairs = evaluate_runs(run_cgnn_function, data, test_graph, loop, **kwargs)
 
             score_network = np.mean([i for i in result_pairs if np.isfinite(i)])
 
-            print("Current score : " + str(score_network))
-            print("Best score : " + str(globalscore))
+            logger.debug('Current score : %s', score_network)
+            logger.debug('Best score : %s', globalscore)
 
             if score_network < globalscore:
                 graph.reverse_edge(edge[0], edge[1])
-                print('Edge {} got reversed !'.format(list_edges[selected_edges]))
+                logger.info('Edge %s got reversed !', list_edges[selected_edges])
                 globalscore = score_network
 
+    if kwargs.get("profiler") is not None:
+        kwargs["profiler"].end_search('exploratory_hill_climbing')
     return graph
 
 
@@ -477,36 +519,52 @@ class CGNN_confounders(GraphModel):
         elif self.backend == 'PyTorch':
             self.infer_graph = run_CGNN_th
         else:
-            print('No backend known as {}'.format(self.backend))
-            raise ValueError
+            raise ValueError('No backend known as {}'.format(self.backend))
 
     def create_graph_from_data(self, data):
-        print("The CGNN model is not able (yet?) to model the graph directly from raw data")
-        raise ValueError
+        raise ValueError("The CGNN model is not able (yet?) to model the graph directly from raw data")
 
     def orient_directed_graph(self, data, dag, alg='HC', **kwargs):
         """ Improve a directed acyclic graph using CGNN
 
-        :param data: data
+        :param data: data (Dataset or pandas.DataFrame, see utils.Dataset and utils.Formats.read_numdata)
         :param dag: directed acyclic graph to optimize
         :param alg: type of algorithm
         :param log: Save logs of the execution
         :return: improved directed acyclic graph
         """
-        data = DataFrame(scale(data.as_matrix()), columns=data.columns)
+        # Standardized once ; the workers only receive the name of the shared file
+        dataset = as_dataset(data)
+        shared = dataset.filename is None
+        dataset.share()
         alg_dic = {'HC': hill_climbing_confounders, 'tabu': tabu_search, 'EHC': exploratory_hill_climbing}
-        return alg_dic[alg](dag, data, self.infer_graph, **kwargs)
+        try:
+            return alg_dic[alg](dag, dataset, self.infer_graph, **kwargs)
+        finally:
+            if shared:
+                dataset.release()
 
     def orient_undirected_graph(self, data, umg, **kwargs):
         """ Orient the undirected graph using GNN and apply CGNN to improve the graph
 
         :param data: data
-        :param umg: undirected acyclic graph
+        :param umg: undirected acyclic graph, skeleton of the returned graph
+        :param kwargs: init_mechanisms=(SETTINGS.init_mechanisms) initialize the mechanisms of CGNN
+         with the mechanisms trained by GNN ; not available with batched_pairwise and scheduled_pairwise
         :return: directed acyclic graph
         """
 
         warnings.warn("The pairwise GNN model is computed on each edge of the UMG "
                       "to initialize the model and start CGNN with a DAG")
-        gnn = GNN(backend=self.backend, **kwargs)
-        dag = gnn.orient_graph(data, umg, **kwargs)  # Pairwise method
+        init_mechanisms = kwargs.get('init_mechanisms', SETTINGS.init_mechanisms)
+        data = as_dataset(data)  # Standardized once for GNN and CGNN
+        gnn = GNN(backend=self.backend)
+        # Pairwise method ; the confounder model needs the skeleton of the graph
+        if init_mechanisms:
+            dag = gnn.orient_graph_confounders(data, umg, **dict(kwargs, keep_mechanisms=True))
+            kwargs['mechanisms'] = gnn.edge_mechanisms
+        else:
+            dag = gnn.orient_graph_confounders(data, umg, **kwargs)
+        if kwargs.get("profiler") is not None:
+            kwargs["profiler"].end_search('pairwise')
         return self.orient_directed_graph(data, dag, **kwargs)
@@ -4,7 +4,9 @@ Authors : Olivier Goudet & Diviyan Kalainathan
 Ref:
 Date : 10/05/2017
 """
+import logging
 import os
+import time
 import tensorflow as tf
 
 #os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
@@ -12,12 +14,21 @@ import tensorflow as tf
 import numpy as np
 from .utils.Loss import MMD_loss_tf as MMD_tf
 from .utils.Loss import Fourier_MMD_Loss_tf as Fourier_MMD_tf
+from .utils.Loss import MMD_loss_batch_tf as MMD_batch_tf
+from .utils.Loss import Fourier_MMD_Loss_batch_tf as Fourier_MMD_batch_tf
+from .utils.Dataset import as_dataset
+from .utils.Log import configure_worker, get_logger, logging_config
+from .utils.Profiler import mark, profiled, run_profile, trace_options, trace_step, write_trace
 from .utils.Settings import SETTINGS
+from itertools import islice
 from joblib import Parallel, delayed
+from scipy.stats import t as student_t
 from sklearn.preprocessing import scale
 from .PairwiseModel import Pairwise_Model
 import pandas as pd
 
+logger = get_logger(__name__)
+
 def init(size, **kwargs):
     """ Initialize a random tensor, normal(0,kwargs(SETTINGS.init_weights)).
 
@@ -59,6 +70,7 @@ class GNN_tf(object):
 
         theta_G = [W_in, b_in,
                    W_out, b_out]
+        self.theta_G = theta_G
 
 
         e = tf.random_normal([N, 1], mean=0, stddev=1)
@@ -74,10 +86,14 @@ class GNN_tf(object):
         self.G_solver_xcausesy = (tf.train.AdamOptimizer(learning_rate=learning_rate)
                                   .minimize(self.G_dist_loss_xcausesy, var_list=theta_G))
 
+        profile = kwargs.get('profile')
+        mark(profile, 'build')
+
         config = tf.ConfigProto()
         config.gpu_options.allow_growth = True
         self.sess = tf.Session(config=config)
         self.sess.run(tf.global_variables_initializer())
+        mark(profile, 'session')
 
     def train(self, data, verbose=True, **kwargs):
         """ Train the GNN model
@@ -85,21 +101,31 @@ class GNN_tf(object):
         :param data: data corresponding to the graph
         :param verbose: verbose
         :param kwargs: train_epochs=(SETTINGS.nb_epoch_train) number of train epochs
+        :param kwargs: profile=(None) RunProfile of the run (see utils.Profiler)
         :return: None
         """
         train_epochs = kwargs.get('train_epochs', SETTINGS.train_epochs)
+        profile = kwargs.get('profile')
+        traced_step = trace_step(profile, train_epochs)
+        run_kwargs = {}
+        G_dist_loss_xcausesy_curr = None
 
         for it in range(train_epochs):
+            if it == traced_step:
+                run_kwargs = trace_options()
+
             _, G_dist_loss_xcausesy_curr = self.sess.run(
                 [self.G_solver_xcausesy, self.G_dist_loss_xcausesy],
-                feed_dict={self.X: data[:, [0]], self.Y: data[:, [1]]}
+                feed_dict={self.X: data[:, [0]], self.Y: data[:, [1]]}, **run_kwargs
             )
 
-            if verbose:
-                if it % 100 == 0:
-                    print('Pair:{}, Run:{}, Iter:{}, score:{}'.
-                          format(self.pair, self.run,
-                                 it, G_dist_loss_xcausesy_curr))
+            if verbose and it % 100 == 0 and logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Pair:%s, Run:%s, Iter:%s, score:%s',
+                             self.pair, self.run, it, G_dist_loss_xcausesy_curr)
+
+        if profile is not None:
+            write_trace(profile, run_kwargs)
+            profile.set_epochs('train', train_epochs, G_dist_loss_xcausesy_curr)
 
     def evaluate(self, data, verbose=True, **kwargs):
         """ Test the model
@@ -107,6 +133,7 @@ class GNN_tf(object):
         :param data: data corresponding to the graph
         :param verbose: verbose
         :param kwargs: test_epochs=(SETTINGS.nb_epoch_test) number of test epochs
+        :param kwargs: profile=(None) RunProfile of the run (see utils.Profiler)
         :return: mean MMD loss value of the CGNN structure on the data
         """
         test_epochs = kwargs.get('test_epochs', SETTINGS.test_epochs)
@@ -117,19 +144,183 @@ class GNN_tf(object):
 
             avg_score += score[0]
 
-            if verbose:
-                if it % 100 == 0:
-                    print('Pair:{}, Run:{}, Iter:{}, score:{}'.format(self.pair, self.run, it, score[0]))
+            if verbose and it % 100 == 0 and logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Pair:%s, Run:%s, Iter:%s, score:%s', self.pair, self.run, it, score[0])
 
         tf.reset_default_graph()
 
+        if kwargs.get('profile') is not None:
+            kwargs['profile'].set_epochs('evaluate', test_epochs, avg_score / test_epochs)
         return avg_score / test_epochs
 
 
-def tf_evalcausalscore_pairwise(df, idx, run, **kwargs):
+def tf_unit_instance(m, idx, run, direction, **kwargs):
+    """ Execute the GNN of one direction of a pair, by init, train and eval either on CPU or GPU
+
+    :param m: data of the pair for this run : (N, 2) data, already subsampled to SETTINGS.max_nb_points
+     points, the same points being used by both directions of the run
+    :param idx: number of the idx (only for print)
+    :param run: number of the run (only for print)
+    :param direction: 0 to model [:, 0] -> [:, 1], 1 to model [:, 1] -> [:, 0]
+    :param kwargs: gpu=(SETTINGS.GPU) True if GPU is used
+    :param kwargs: nb_gpu=(SETTINGS.NB_GPU) Number of available GPUs
+    :param kwargs: gpu_offset=(SETTINGS.GPU_OFFSET) number of gpu offsets
+    :param kwargs: log_config=(None) logging handlers of the parent process (see utils.Log.configure_worker)
+    :return: MMD loss value of the given direction after training
+    """
+    configure_worker(kwargs.get('log_config'))
+    gpu = kwargs.get('gpu', SETTINGS.GPU)
+    nb_gpu = kwargs.get('nb_gpu', SETTINGS.NB_GPU)
+    gpu_offset = kwargs.get('gpu_offset', SETTINGS.GPU_OFFSET)
+
+    if direction:
+        m = m[:, [1, 0]]
+
+    if gpu:
+        with tf.device('/gpu:' + str(gpu_offset + run % nb_gpu)):
+            return tf_evalcausalscore_pairwise(m, idx, run, direction, **kwargs)
+    else:
+        return tf_evalcausalscore_pairwise(m, idx, run, direction, **kwargs)
+
+
+def unit_result(function, pair, direction, *args, **kwargs):
+    """ Result of a unit, with the unit it belongs to (results of the units come in any order)
+
+    :return: number of the pair, direction, result of function(*args, **kwargs)
+    :rtype: tuple
+    """
+    return pair, direction, function(*args, **kwargs)
+
+
+class GNN_batch_tf(object):
+    def __init__(self, B, N, idx=0, **kwargs):
+        """ Build a tensorflow graph training B independent pairwise generators at once,
+        their parameters being stacked along the first axis.
+        For each element, the first variable is set as the cause and the second as the effect ;
+        elements with less than N points are padded, and their padding is masked in the loss
+
+        :param B: Number of generators
+        :param N: Number of examples to generate
+        :param idx: for log purposes (optional)
+        :param kwargs: h_layer_dim=(SETTINGS.h_layer_dim) Number of units in the hidden layer
+        :param kwargs: learning_rate=(SETTINGS.learning_rate) learning rate of the optimizer
+        :param kwargs: use_Fast_MMD=(SETTINGS.use_Fast_MMD) use fast MMD option
+        :param kwargs: nb_vectors_approx_MMD=(SETTINGS.nb_vectors_approx_MMD) nb vectors
+        """
+
+        h_layer_dim = kwargs.get('h_layer_dim', SETTINGS.h_layer_dim)
+        learning_rate = kwargs.get('learning_rate', SETTINGS.learning_rate)
+        use_Fast_MMD = kwargs.get('use_Fast_MMD', SETTINGS.use_Fast_MMD)
+        nb_vectors_approx_MMD = kwargs.get('nb_vectors_approx_MMD', SETTINGS.nb_vectors_approx_MMD)
+
+        self.idx = idx
+        self.X = tf.placeholder(tf.float32, shape=[B, N, 1])
+        self.Y = tf.placeholder(tf.float32, shape=[B, N, 1])
+        self.M = tf.placeholder(tf.float32, shape=[B, N])
+
+        W_in = tf.Variable(init([B, 2, h_layer_dim], **kwargs))
+        b_in = tf.Variable(init([B, 1, h_layer_dim], **kwargs))
+        W_out = tf.Variable(init([B, h_layer_dim, 1], **kwargs))
+        b_out = tf.Variable(init([B, 1, 1], **kwargs))
+
+        theta_G = [W_in, b_in,
+                   W_out, b_out]
+
+        e = tf.random_normal([B, N, 1], mean=0, stddev=1)
+
+        hid = tf.nn.relu(tf.matmul(tf.concat([self.X, e], 2), W_in) + b_in)
+        out_y = tf.matmul(hid, W_out) + b_out
+
+        if(use_Fast_MMD):
+            self.G_dist_loss_xcausesy = Fourier_MMD_batch_tf(tf.concat([self.X, self.Y], 2), tf.concat([self.X, out_y], 2),
+                                                             nb_vectors_approx_MMD, self.M)
+        else:
+            self.G_dist_loss_xcausesy = MMD_batch_tf(tf.concat([self.X, self.Y], 2), tf.concat([self.X, out_y], 2), self.M)
+
+        # Parameters are independent : minimizing the sum trains each generator on its own loss
+        self.G_solver_xcausesy = (tf.train.AdamOptimizer(learning_rate=learning_rate)
+                                  .minimize(tf.reduce_sum(self.G_dist_loss_xcausesy), var_list=theta_G))
+
+        config = tf.ConfigProto()
+        config.gpu_options.allow_growth = True
+        self.sess = tf.Session(config=config)
+        self.sess.run(tf.global_variables_initializer())
+
+    def train(self, x, y, mask=None, verbose=True, **kwargs):
+        """ Train the generators
+
+        :param x: causes, array of shape (B, N)
+        :param y: effects, array of shape (B, N)
+        :param mask: array of shape (B, N), 1 for the points and 0 for the padding (None : no padding)
+        :param verbose: verbose
+        :param kwargs: train_epochs=(SETTINGS.nb_epoch_train) number of train epochs
+        :return: None
+        """
+        train_epochs = kwargs.get('train_epochs', SETTINGS.train_epochs)
+        feed_dict = {self.X: x[:, :, np.newaxis], self.Y: y[:, :, np.newaxis],
+                     self.M: mask if mask is not None else np.ones(x.shape, dtype='float32')}
+
+        for it in range(train_epochs):
+            _, G_dist_loss_xcausesy_curr = self.sess.run(
+                [self.G_solver_xcausesy, self.G_dist_loss_xcausesy], feed_dict=feed_dict)
+
+            if verbose and it % 100 == 0 and logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Batch:%s, Iter:%s, mean score:%s', self.idx, it, np.mean(G_dist_loss_xcausesy_curr))
+
+    def evaluate(self, x, y, mask=None, verbose=True, **kwargs):
+        """ Test the generators
+
+        :param x: causes, array of shape (B, N)
+        :param y: effects, array of shape (B, N)
+        :param mask: array of shape (B, N), 1 for the points and 0 for the padding (None : no padding)
+        :param verbose: verbose
+        :param kwargs: test_epochs=(SETTINGS.nb_epoch_test) number of test epochs
+        :return: mean MMD loss value of each generator, array of shape (B,)
+        """
+        test_epochs = kwargs.get('test_epochs', SETTINGS.test_epochs)
+        feed_dict = {self.X: x[:, :, np.newaxis], self.Y: y[:, :, np.newaxis],
+                     self.M: mask if mask is not None else np.ones(x.shape, dtype='float32')}
+        avg_score = 0
+
+        for it in range(test_epochs):
+            score = self.sess.run(self.G_dist_loss_xcausesy, feed_dict=feed_dict)
+
+            avg_score += score
+
+            if verbose and it % 100 == 0 and logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Batch:%s, Iter:%s, mean score:%s', self.idx, it, np.mean(score))
+
+        tf.reset_default_graph()
+
+        return avg_score / test_epochs
+
+
+def tf_evalcausalscore_pairwise(df, idx, run, direction=0, **kwargs):
+    profile = run_profile(idx, run, direction, **kwargs)
+    kwargs['profile'] = profile
     GNN = GNN_tf(df.shape[0], run, idx, **kwargs)
     GNN.train(df, **kwargs)
-    return GNN.evaluate(df, **kwargs)
+    mark(profile, 'train')
+    score = GNN.evaluate(df, **kwargs)
+    mark(profile, 'evaluate')
+    return profiled(score, profile)
+
+
+def tf_mechanism_pairwise(df, idx, run, direction=0, **kwargs):
+    """ Same as tf_evalcausalscore_pairwise, also returning the trained mechanism
+
+    :return: MMD loss value after training, weights [W_in, b_in, W_out, b_out] of the mechanism
+    :rtype: tuple
+    """
+    profile = run_profile(idx, run, direction, **kwargs)
+    kwargs['profile'] = profile
+    GNN = GNN_tf(df.shape[0], run, idx, **kwargs)
+    GNN.train(df, **kwargs)
+    mechanism = GNN.sess.run(GNN.theta_G)
+    mark(profile, 'train')
+    score = GNN.evaluate(df, **kwargs)
+    mark(profile, 'evaluate')
+    return profiled(score, profile), mechanism
 
 
 def tf_run_instance(m, idx, run, **kwargs):
@@ -141,11 +332,16 @@ def tf_run_instance(m, idx, run, **kwargs):
     :param kwargs: gpu=(SETTINGS.GPU) True if GPU is used
     :param kwargs: nb_gpu=(SETTINGS.NB_GPU) Number of available GPUs
     :param kwargs: gpu_offset=(SETTINGS.GPU_OFFSET) number of gpu offsets
+    :param kwargs: keep_mechanisms=(False) also return the trained mechanisms (see tf_mechanism_pairwise)
+    :param kwargs: profile_runs=(False) return ProfiledScore with the records of the runs (see utils.Profiler)
+    :param kwargs: log_config=(None) logging handlers of the parent process (see utils.Log.configure_worker)
     :return: MMD loss value of the given structure after training
     """
+    configure_worker(kwargs.get('log_config'))
     gpu = kwargs.get('gpu', SETTINGS.GPU)
     nb_gpu = kwargs.get('nb_gpu', SETTINGS.NB_GPU)
     gpu_offset = kwargs.get('gpu_offset', SETTINGS.GPU_OFFSET)
+    evalcausalscore = tf_mechanism_pairwise if kwargs.get('keep_mechanisms', False) else tf_evalcausalscore_pairwise
 
     if (m.shape[0] > SETTINGS.max_nb_points):
 
@@ -157,14 +353,132 @@ def tf_run_instance(m, idx, run, **kwargs):
     run_i = run
     if gpu:
         with tf.device('/gpu:' + str(gpu_offset + run_i % nb_gpu)):
-            XY = tf_evalcausalscore_pairwise(m, idx, run, **kwargs)
+            XY = evalcausalscore(m, idx, run, 0, **kwargs)
         with tf.device('/gpu:' + str(gpu_offset + run_i % nb_gpu)):
-            YX = tf_evalcausalscore_pairwise(m[:, [1, 0]], idx, run, **kwargs)
+            YX = evalcausalscore(m[:, [1, 0]], idx, run, 1, **kwargs)
             return [XY, YX]
     else:
-        return [tf_evalcausalscore_pairwise(m, idx, run, **kwargs),
-                tf_evalcausalscore_pairwise(np.fliplr(m), idx, run, **kwargs)]
+        return [evalcausalscore(m, idx, run, 0, **kwargs),
+                evalcausalscore(np.fliplr(m), idx, run, 1, **kwargs)]
+
+
+def tf_batch_instance(x, y, mask, idx, **kwargs):
+    """ Train and evaluate a batch of pairwise generators in one vectorized model, either on CPU or GPU
+
+    :param x: causes, array of shape (B, N)
+    :param y: effects, array of shape (B, N)
+    :param mask: array of shape (B, N), 1 for the points and 0 for the padding
+    :param idx: number of the batch (only for print)
+    :param kwargs: gpu=(SETTINGS.GPU) True if GPU is used
+    :param kwargs: nb_gpu=(SETTINGS.NB_GPU) Number of available GPUs
+    :param kwargs: gpu_offset=(SETTINGS.GPU_OFFSET) number of gpu offsets
+    :param kwargs: log_config=(None) logging handlers of the parent process (see utils.Log.configure_worker)
+    :return: MMD loss values of the generators x -> y after training, array of shape (B,)
+    """
+    configure_worker(kwargs.get('log_config'))
+    gpu = kwargs.get('gpu', SETTINGS.GPU)
+    nb_gpu = kwargs.get('nb_gpu', SETTINGS.NB_GPU)
+    gpu_offset = kwargs.get('gpu_offset', SETTINGS.GPU_OFFSET)
+
+    if gpu:
+        with tf.device('/gpu:' + str(gpu_offset + idx % nb_gpu)):
+            model = GNN_batch_tf(x.shape[0], x.shape[1], idx, **kwargs)
+            model.train(x, y, mask, **kwargs)
+            return model.evaluate(x, y, mask, **kwargs)
+    else:
+        model = GNN_batch_tf(x.shape[0], x.shape[1], idx, **kwargs)
+        model.train(x, y, mask, **kwargs)
+        return model.evaluate(x, y, mask, **kwargs)
+
 
+def batch_units(pairs, units, max_nb_points):
+    """ Stack the data of (pair, run, direction) units, each run of a pair with its own subsample of the
+    points, shared by its two directions. Units with less points than the longest one are padded with zeros
+
+    :param pairs: list of (N_i, 2) arrays
+    :param units: list of (pair number, run, direction) ; direction 0 : a -> b, 1 : b -> a,
+     the two directions of a run being in the same list
+    :param max_nb_points: maximal number of points of each unit
+    :return: causes, effects and mask of the points, arrays of shape (len(units), n), n being the
+     largest min(N_i, max_nb_points) of the units
+    """
+    n = int(min(max(pairs[pair].shape[0] for pair, _, _ in units), max_nb_points))
+    x = np.zeros((len(units), n), dtype='float32')
+    y = np.zeros((len(units), n), dtype='float32')
+    mask = np.zeros((len(units), n), dtype='float32')
+    subsamples = {}
+    for i, (pair, run, direction) in enumerate(units):
+        N = pairs[pair].shape[0]
+        if (pair, run) not in subsamples:
+            # Both directions of a run are scored on the same points
+            subsamples[(pair, run)] = np.random.permutation(N)[:n] if N > n else slice(None)
+        rows = subsamples[(pair, run)]
+        n_i = min(N, n)
+        x[i, :n_i] = pairs[pair][rows, direction]
+        y[i, :n_i] = pairs[pair][rows, 1 - direction]
+        mask[i, :n_i] = 1
+    return x, y, mask
+
+
+def matrix_units(data, units, max_nb_points):
+    """ Stack the data of (cause column, effect column, run) units of a data matrix,
+    each run of a pair of columns with its own subsample of the rows, shared by its two directions
+
+    :param data: standardized data matrix, array of shape (N, V)
+    :param units: list of (cause column, effect column, run), the two directions of a run
+     being in the same list
+    :param max_nb_points: maximal number of points of each unit
+    :return: causes and effects, arrays of shape (len(units), min(N, max_nb_points))
+    """
+    N = data.shape[0]
+    n = int(min(N, max_nb_points))
+    x = np.empty((len(units), n), dtype='float32')
+    y = np.empty((len(units), n), dtype='float32')
+    subsamples = {}
+    for k, (cause, effect, run) in enumerate(units):
+        key = (min(cause, effect), max(cause, effect), run)
+        if key not in subsamples:
+            # Both directions of a run are scored on the same rows
+            subsamples[key] = np.random.permutation(N)[:n] if N > n else slice(None)
+        rows = subsamples[key]
+        x[k] = data[rows, cause]
+        y[k] = data[rows, effect]
+    return x, y
+
+
+def tf_matrix_instance(data, units, idx, **kwargs):
+    """ Train and evaluate the generators of a chunk of units of a data matrix in one vectorized model
+
+    :param data: standardized data matrix, array of shape (N, V)
+    :param units: list of (cause column, effect column, run)
+    :param idx: number of the chunk (only for print)
+    :return: MMD loss values of the generators after training, array of shape (len(units),)
+    """
+    x, y = matrix_units(data, units, SETTINGS.max_nb_points)
+    return tf_batch_instance(x, y, None, idx, **kwargs)
+
+
+def sign_settled(differences, confidence, nb_looks=1, min_runs=2):
+    """ Sequential stopping rule : two-sided Student t-test of a null mean of the paired differences
+    between the scores of the two directions. The test being repeated after each wave of runs, its level
+    is split between the nb_looks tests (Bonferroni) so that the overall error rate stays below 1 - confidence
+
+    :param differences: score_BA - score_AB of each run
+    :param confidence: overall confidence on the sign of the mean difference
+    :param nb_looks: maximal number of tests performed on the runs of the pair
+    :param min_runs: minimal number of runs before the first test (at least 2)
+    :return: True if the sign of the mean difference is settled
+    :rtype: bool
+    """
+    n = len(differences)
+    if n < max(min_runs, 2):
+        return False
+    mean = np.mean(differences)
+    std = np.std(differences, ddof=1)
+    if std == 0:
+        return mean != 0
+    alpha = (1 - confidence) / nb_looks
+    return abs(mean) / (std / np.sqrt(n)) >= student_t.ppf(1 - alpha / 2, n - 1)
 
 
 class GNN(Pairwise_Model):
@@ -176,8 +490,27 @@ class GNN(Pairwise_Model):
     def __init__(self, backend="PyTorch"):
         super(GNN, self).__init__()
         self.backend = backend
+        self.runs_used = {}
+        self.mechanisms = {}
+        self.edge_mechanisms = {}
 
     def predict_proba(self, a, b,idx=0, **kwargs):
+        """ Prediction for a pair ; the number of runs of each pair is kept in self.runs_used
+
+        :param a: Variable 1
+        :param b: Variable 2
+        :param idx: number of the pair
+        :param kwargs: nb_jobs=(SETTINGS.NB_JOBS) number of jobs
+        :param kwargs: nb_runs=(SETTINGS.NB_RUNS) number of runs (maximal number of runs in adaptive mode)
+        :param kwargs: adaptive_runs=(SETTINGS.adaptive_runs) stop the runs once the orientation is settled
+        :param kwargs: runs_per_wave=(SETTINGS.runs_per_wave) number of runs between two stopping tests
+        :param kwargs: min_runs=(SETTINGS.min_runs) minimal number of runs before the first stopping test
+        :param kwargs: stopping_confidence=(SETTINGS.stopping_confidence) overall confidence of the stopping tests
+        :param kwargs: keep_mechanisms=(False) keep in self.mechanisms[idx] the weights of the best run of each direction
+        :param kwargs: profiler=(None) Profiler collecting the records of the runs (see utils.Profiler)
+        :return: probability (Value : 1 if a->b and -1 if b->a)
+        :rtype: float
+        """
 
         backend_alg_dic = {"TensorFlow": tf_run_instance}
         if len(np.array(a).shape) == 1:
@@ -187,21 +520,220 @@ class GNN(Pairwise_Model):
         nb_jobs = kwargs.get("nb_jobs", SETTINGS.NB_JOBS)
         nb_runs = kwargs.get("nb_runs", SETTINGS.NB_RUNS)
         m = np.hstack((a, b))
-        m = m.astype('float32')
-        
+        m = m.astype('float32', copy=False)
+        kwargs['log_config'] = logging_config()
+
+        profiler = kwargs.pop("profiler", None)
+        if profiler is not None:
+            kwargs["profile_runs"] = True
+            start = time.time()
+
+        keep_mechanisms = kwargs.get("keep_mechanisms", False)
+        # Score of a direction in a run, possibly returned with its mechanism
+        score = (lambda result: result[0]) if keep_mechanisms else (lambda result: result)
+
+        if kwargs.get("adaptive_runs", SETTINGS.adaptive_runs):
+            runs_per_wave = kwargs.get("runs_per_wave", SETTINGS.runs_per_wave)
+            min_runs = kwargs.get("min_runs", SETTINGS.min_runs)
+            stopping_confidence = kwargs.get("stopping_confidence", SETTINGS.stopping_confidence)
+            # Tests after the waves ending between min_runs and nb_runs (excluded)
+            nb_looks = max(1, len([n for n in range(runs_per_wave, nb_runs, runs_per_wave) if n >= min_runs]))
+            result_pair = []
+
+            while len(result_pair) < nb_runs:
+                runs = range(len(result_pair), min(len(result_pair) + runs_per_wave, nb_runs))
+                result_pair += Parallel(n_jobs=nb_jobs)(delayed(backend_alg_dic[self.backend])(
+                    m, idx, run, **kwargs) for run in runs)
+                if sign_settled([score(runpair[1]) - score(runpair[0]) for runpair in result_pair],
+                                stopping_confidence, nb_looks, min_runs):
+                    break
+            logger.info('Pair:%s, %s runs', idx, len(result_pair))
+        else:
+            result_pair = Parallel(n_jobs=nb_jobs)(delayed(backend_alg_dic[self.backend])(
+                m, idx, run, **kwargs) for run in range(nb_runs))
+        self.runs_used[idx] = len(result_pair)
+        if profiler is not None:
+            profiler.add_candidate(idx, result_pair, time.time() - start)
+
+        if keep_mechanisms:
+            self.mechanisms[idx] = (min((runpair[0] for runpair in result_pair), key=score)[1],
+                                    min((runpair[1] for runpair in result_pair), key=score)[1])
+            result_pair = [[score(runpair[0]), score(runpair[1])] for runpair in result_pair]
 
-        result_pair = Parallel(n_jobs=nb_jobs)(delayed(backend_alg_dic[self.backend])(
-            m, idx, run, **kwargs) for run in range(nb_runs))
-     
         score_AB = np.mean([runpair[0] for runpair in result_pair])
         score_BA = np.mean([runpair[1] for runpair in result_pair])
-        
-        for runpair in result_pair:
-            print(runpair[0])
-        print(score_AB)
 
-        for runpair in result_pair:
-            print(runpair[1])
-        print(score_BA)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Pair:%s, scores AB:%s, mean:%s', idx, [runpair[0] for runpair in result_pair], score_AB)
+            logger.debug('Pair:%s, scores BA:%s, mean:%s', idx, [runpair[1] for runpair in result_pair], score_BA)
 
         return (score_BA - score_AB) / (score_BA + score_AB)
+
+    def _predict_edges(self, df_data, edges, printout=None, resume=False, **kwargs):
+        """ Predictions for the edges of a graph ; with keep_mechanisms, the mechanisms trained by
+        predict_proba are kept in self.edge_mechanisms as {(cause, effect): [W_in, b_in, W_out, b_out]}
+        """
+        self.mechanisms = {}
+        weights = super(GNN, self)._predict_edges(df_data, edges, printout, resume, **kwargs)
+
+        if kwargs.get("keep_mechanisms", False):
+            self.edge_mechanisms = {}
+            for j, (mechanism_ab, mechanism_ba) in self.mechanisms.items():
+                a, b = edges[self.model_positions[j]]
+                self.edge_mechanisms[(a, b)] = mechanism_ab
+                self.edge_mechanisms[(b, a)] = mechanism_ba
+        return weights
+
+    def predict_pairs(self, pairs, idx=0, **kwargs):
+        """ Predictions for an iterable of pairs. With scheduled_pairwise, all the
+        (pair, run, direction) units are flattened into a single queue over a persistent
+        pool of nb_jobs workers, and each pair is yielded as soon as all its units are done.
+        The options of predict_proba keep_mechanisms, adaptive_runs and profiler are not available
+
+        :param pairs: iterable of (a, b) variables
+        :param idx: index of the first pair
+        :param kwargs: scheduled_pairwise=(SETTINGS.scheduled_pairwise) use the global scheduler
+        :param kwargs: nb_jobs=(SETTINGS.NB_JOBS) number of workers
+        :param kwargs: nb_runs=(SETTINGS.NB_RUNS) number of runs
+        :return: iterator of (number of the pair, probability), in the order of completion
+        """
+        if not kwargs.get('scheduled_pairwise', SETTINGS.scheduled_pairwise):
+            for result in super(GNN, self).predict_pairs(pairs, idx, **kwargs):
+                yield result
+            return
+
+        unsupported = [name for name, value in (('keep_mechanisms', kwargs.get('keep_mechanisms', False)),
+                                                ('adaptive_runs', kwargs.get('adaptive_runs', SETTINGS.adaptive_runs)),
+                                                ('profiler', kwargs.get('profiler'))) if value]
+        if unsupported:
+            raise ValueError('Options not available with scheduled_pairwise : {}'.format(', '.join(unsupported)))
+
+        backend_alg_dic = {"TensorFlow": tf_unit_instance}
+        nb_jobs = kwargs.get("nb_jobs", SETTINGS.NB_JOBS)
+        nb_runs = kwargs.get("nb_runs", SETTINGS.NB_RUNS)
+        max_nb_points = int(SETTINGS.max_nb_points)
+        kwargs['log_config'] = logging_config()
+        scores = {}
+
+        def list_units():
+            for i, (a, b) in enumerate(pairs):
+                m = np.hstack((np.array(a).reshape((-1, 1)), np.array(b).reshape((-1, 1)))).astype('float32', copy=False)
+                scores[i] = [0., 0., 2 * nb_runs]
+                for run in range(nb_runs):
+                    # Both directions of a run are scored on the same points
+                    m_run = m[np.random.permutation(m.shape[0])[:max_nb_points]] if m.shape[0] > max_nb_points else m
+                    for direction in (0, 1):
+                        yield delayed(unit_result)(backend_alg_dic[self.backend], i, direction,
+                                                   m_run, idx + i, run, direction, **kwargs)
+
+        # Bounded number of dispatched units : pairs are read as the workers need them
+        results = Parallel(n_jobs=nb_jobs, return_as='generator_unordered', pre_dispatch='2*n_jobs')(list_units())
+
+        for i, direction, result in results:
+            score = scores[i]
+            score[direction] += result / nb_runs
+            score[2] -= 1
+            if not score[2]:
+                del scores[i]
+                score_AB, score_BA = score[:2]
+                yield i, (score_BA - score_AB) / (score_BA + score_AB)
+
+    def predict_proba_batch(self, pairs, idx=0, **kwargs):
+        """ Prediction for many pairs : the generators of all the pairs, runs and directions
+        are trained in batches of vectorized models of batch_size pairs. Pairs are sorted by number of
+        points so that each batch gathers pairs of similar lengths, padded to the longest one and masked
+        (see batch_units) ; all the units of a pair are in the same batch.
+        The option of predict_proba keep_mechanisms is not available
+
+        :param pairs: list of (a, b) variables
+        :param idx: number of the first batch (only for print)
+        :param kwargs: nb_jobs=(SETTINGS.NB_JOBS) number of jobs
+        :param kwargs: nb_runs=(SETTINGS.NB_RUNS) number of runs
+        :param kwargs: batch_size=(SETTINGS.batch_size) number of pairs trained in a same model,
+         i.e. batch_size * 2 * nb_runs generators
+        :return: probabilities (Value : 1 if a->b and -1 if b->a)
+        :rtype: list
+        """
+        if kwargs.get('keep_mechanisms', False):
+            raise ValueError('Option not available with batched_pairwise : keep_mechanisms')
+
+        backend_alg_dic = {"TensorFlow": tf_batch_instance}
+        nb_jobs = kwargs.get("nb_jobs", SETTINGS.NB_JOBS)
+        nb_runs = kwargs.get("nb_runs", SETTINGS.NB_RUNS)
+        batch_size = kwargs.get("batch_size", SETTINGS.batch_size)
+        kwargs['log_config'] = logging_config()
+
+        pairs = [np.hstack((np.array(a).reshape((-1, 1)), np.array(b).reshape((-1, 1)))).astype('float32', copy=False)
+                 for a, b in pairs]
+        # Length buckets : consecutive units in the order of the number of points
+        lengths = [min(m.shape[0], SETTINGS.max_nb_points) for m in pairs]
+        units = [(pair, run, direction) for pair in sorted(range(len(pairs)), key=lambda p: lengths[p])
+                 for run in range(nb_runs) for direction in (0, 1)]
+        chunk_size = batch_size * 2 * nb_runs
+        chunks = [units[i:i + chunk_size] for i in range(0, len(units), chunk_size)]
+
+        result_chunks = Parallel(n_jobs=nb_jobs)(delayed(backend_alg_dic[self.backend])(
+            *batch_units(pairs, chunk, SETTINGS.max_nb_points), idx=idx + i, **kwargs)
+            for i, chunk in enumerate(chunks))
+
+        scores = np.zeros((len(pairs), 2))
+        for chunk, result in zip(chunks, result_chunks):
+            for (pair, run, direction), score in zip(chunk, result):
+                scores[pair, direction] += score / nb_runs
+
+        score_AB = scores[:, 0]
+        score_BA = scores[:, 1]
+        return list((score_BA - score_AB) / (score_BA + score_AB))
+
+    def predict_matrix(self, df_data, **kwargs):
+        """ Asymmetry scores of all the pairs of variables of a dataset. The (pair, run, direction)
+        units are trained in chunks of batch_size pairs, chunks being generated as the workers
+        consume them ; the standardized data matrix is shared with the workers
+
+        :param df_data: dataset (Dataset or pandas.DataFrame, see utils.Dataset)
+        :param kwargs: nb_jobs=(SETTINGS.NB_JOBS) number of jobs
+        :param kwargs: nb_runs=(SETTINGS.NB_RUNS) number of runs
+        :param kwargs: batch_size=(SETTINGS.batch_size) number of pairs trained in a same model,
+         i.e. batch_size * 2 * nb_runs generators
+        :return: V x V matrix, the value at (a, b) being the probability of a->b (1 if a->b and -1 if b->a)
+        :rtype: pandas.DataFrame
+        """
+        backend_alg_dic = {"TensorFlow": tf_matrix_instance}
+        nb_jobs = kwargs.get("nb_jobs", SETTINGS.NB_JOBS)
+        nb_runs = kwargs.get("nb_runs", SETTINGS.NB_RUNS)
+        batch_size = kwargs.get("batch_size", SETTINGS.batch_size)
+        kwargs['log_config'] = logging_config()
+
+        dataset = as_dataset(df_data)
+        data = dataset.values
+        V = data.shape[1]
+
+        def list_units():
+            for i in range(V):
+                for j in range(i + 1, V):
+                    for run in range(nb_runs):
+                        yield i, j, run
+                        yield j, i, run
+
+        def list_chunks():
+            units = list_units()
+            chunk = list(islice(units, batch_size * 2 * nb_runs))
+            while chunk:
+                yield chunk
+                chunk = list(islice(units, batch_size * 2 * nb_runs))
+
+        # Only the chunks being processed are kept in memory ; the results come in the order of the chunks
+        results = Parallel(n_jobs=nb_jobs, return_as='generator')(
+            delayed(backend_alg_dic[self.backend])(data, chunk, idx, **kwargs)
+            for idx, chunk in enumerate(list_chunks()))
+
+        scores = np.zeros((V, V))
+        for chunk, result in zip(list_chunks(), results):
+            for (cause, effect, run), score in zip(chunk, result):
+                scores[cause, effect] += score / nb_runs
+
+        # scores[a, b] : loss of a->b ; scores[b, a] : loss of b->a
+        with np.errstate(invalid='ignore'):
+            proba = (scores.T - scores) / (scores.T + scores)
+        np.fill_diagonal(proba, 0)
+        return pd.DataFrame(proba, index=dataset.columns, columns=dataset.columns)
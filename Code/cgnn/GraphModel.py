@@ -31,8 +31,7 @@ class GraphModel(object):
         elif type(graph) == UndirectedGraph:
             return self.orient_undirected_graph(df_data, graph, **kwargs)
         else:
-            print('Unknown Graph type')
-            raise ValueError
+            raise ValueError('Unknown Graph type')
 
     def orient_undirected_graph(self, data, umg, **kwargs):
 
@@ -4,8 +4,14 @@ Author: Diviyan Kalainathan
 Date : 7/06/2017
 """
 from .utils.Graph import DirectedGraph
+from .utils.Cascade import cascade_score
+from .utils.Dataset import as_dataset
+from .utils.Formats import PredictionWriter
+from .utils.Log import get_logger
+from .utils.Settings import SETTINGS
 from sklearn.preprocessing import scale
-from pandas import DataFrame
+
+logger = get_logger(__name__)
 
 
 class Pairwise_Model(object):
@@ -18,7 +24,7 @@ class Pairwise_Model(object):
         """ Init. """
         super(Pairwise_Model, self).__init__()
 
-    def predict_proba(self, a, b, idx=0):
+    def predict_proba(self, a, b, idx=0, **kwargs):
         """ Prediction method for pairwise causal inference.
         predict is meant to be overridden in all subclasses
 
@@ -29,97 +35,192 @@ class Pairwise_Model(object):
         """
         raise NotImplementedError
 
-    def predict_dataset(self, x, printout=None):
+    def predict_proba_batch(self, pairs, idx=0, **kwargs):
+        """ Prediction method for a list of pairs ; may be overridden by subclasses
+        able to process many pairs at once
+
+        :param pairs: list of (a, b) variables
+        :param idx: index of the first pair
+        :return: probabilities (Value : 1 if a->b and -1 if b->a)
+        :rtype: list
+        """
+        return [self.predict_proba(a, b, idx + i, **kwargs) for i, (a, b) in enumerate(pairs)]
+
+    def predict_pairs(self, pairs, idx=0, **kwargs):
+        """ Predictions for an iterable of pairs, one by one or in batches
+
+        :param pairs: iterable of (a, b) variables
+        :param idx: index of the first pair
+        :param kwargs: batched_pairwise=(SETTINGS.batched_pairwise) process all the pairs at once (see predict_proba_batch)
+        :return: iterator of (number of the pair, probability) ; subclasses may yield the pairs out of order
+        """
+        if kwargs.get('batched_pairwise', SETTINGS.batched_pairwise):
+            return enumerate(self.predict_proba_batch(list(pairs), idx, **kwargs))
+        return ((i, self.predict_proba(a, b, idx + i, **kwargs)) for i, (a, b) in enumerate(pairs))
+
+    def screen_pairs(self, pairs, **kwargs):
+        """ Cascade of cheap scores computed for all the pairs at once : at each stage, the pairs
+        whose absolute score reaches the threshold are oriented by this score, and the others go
+        to the next stage. The number of pairs of each stage is kept in self.cascade_counts
+
+        :param pairs: list of (a, b) variables
+        :param kwargs: cascade_stages=(SETTINGS.cascade_stages) list of (score, threshold), score being a key of utils.Cascade.cascade_scores
+        :return: dict {pair number: probability} of the decided pairs, list of the numbers of the other pairs
+        :rtype: tuple
+        """
+        stages = kwargs.get('cascade_stages', SETTINGS.cascade_stages)
+        decided = {}
+        remaining = list(range(len(pairs)))
+        self.cascade_counts = []
+
+        for name, threshold in stages:
+            if not remaining:
+                break
+            scores = cascade_score(name, [pairs[i] for i in remaining])
+            undecided = []
+            for i, score in zip(remaining, scores):
+                if abs(score) >= threshold:
+                    decided[i] = float(score)
+                else:
+                    undecided.append(i)
+            self.cascade_counts.append((name, len(remaining), len(remaining) - len(undecided)))
+            logger.info('Cascade %s : %s pairs decided out of %s', name, len(remaining) - len(undecided),
+                        len(remaining))
+            remaining = undecided
+
+        self.cascade_counts.append(('model', len(remaining), len(remaining)))
+        logger.info('Cascade : %s pairs left to the model', len(remaining))
+        return decided, remaining
+
+    def predict_dataset(self, x, printout=None, resume=False, **kwargs):
         """ Causal prediction of a pairwise dataset (x,y)
 
-        :param x: Pairwise dataset
+        :param x: Pairwise dataset (see utils.Formats.CCEPC_PairsFileReader and read_pairs)
         :param printout: print regularly predictions
+        :param resume: reuse the predictions of an existing printout file and skip their pairs
         :type x: cepc_df format
         :return: predictions probabilities
         :rtype: list
         """
 
-        pred = []
-        res = []
-        for idx, row in x.iterrows():
-
-                a = scale(row['A'].reshape((len(row['A']), 1)))
-                b = scale(row['B'].reshape((len(row['B']), 1)))
+        def get_pair(i):
+            a, b = x['A'].iloc[i], x['B'].iloc[i]
+            # Datasets read from a binary cache are float32 : scale in double precision
+            a, b = a.astype('float64').reshape((len(a), 1)), b.astype('float64').reshape((len(b), 1))
+            return scale(a, copy=False), scale(b, copy=False)
 
-                pred.append(self.predict_proba(a, b,idx))
+        return self._predict_printout(list(x['SampleID']), get_pair, printout, resume, **kwargs)
 
-                if printout is not None:
-                    res.append([row['SampleID'], pred[-1]])
-                    DataFrame(res, columns=['SampleID', 'Predictions']).to_csv(
-                        printout, index=False)
-        return pred
-
-    def orient_graph(self, df_data, umg, printout=None):
+    def orient_graph(self, df_data, umg, printout=None, resume=False, **kwargs):
         """ Orient an undirected graph using the pairwise method defined by the subclass
         Requirement : Name of the nodes in the graph correspond to name of the variables in df_data
 
-        :param df_data: dataset
+        :param df_data: dataset (Dataset or pandas.DataFrame, see utils.Dataset and utils.Formats.read_numdata)
         :param umg: UndirectedGraph
         :param printout: print regularly predictions
+        :param resume: reuse the predictions of an existing printout file and skip their edges
         :return: Directed graph w/ weights
         :rtype: DirectedGraph
         """
 
         edges = umg.get_list_edges_without_duplicate()
         graph = DirectedGraph()
-        res = []
-        idx = 0
-
-        for edge in edges:
-            a, b = edge
-            weight = self.predict_proba(scale(df_data[a].as_matrix()), scale(df_data[b].as_matrix()),idx)
 
+        for (a, b), weight in zip(edges, self._predict_edges(df_data, edges, printout, resume, **kwargs)):
             if weight > 0:  # a causes b
                 graph.add(a, b, weight)
             else:
                 graph.add(b, a, abs(weight))
-            if printout is not None:
-                res.append([str(a) + '-' + str(b), weight])
-                DataFrame(res, columns=['SampleID', 'Predictions']).to_csv(
-                    printout, index=False)
-
-            idx += 1
 
         graph.remove_cycle_without_deletion()
 
         return graph
 
-    def orient_graph_confounders(self, df_data, umg, printout=None):
+    def orient_graph_confounders(self, df_data, umg, printout=None, resume=False, **kwargs):
         """ Orient an undirected graph using the pairwise method defined by the subclass
         Requirement : Name of the nodes in the graph correspond to name of the variables in df_data
 
-        :param df_data: dataset
+        :param df_data: dataset (Dataset or pandas.DataFrame, see utils.Dataset and utils.Formats.read_numdata)
         :param umg: UndirectedGraph
         :param printout: print regularly predictions
+        :param resume: reuse the predictions of an existing printout file and skip their edges
         :return: Directed graph w/ weights
         :rtype: DirectedGraph
         """
 
         edges = umg.get_list_edges_without_duplicate()
         graph = DirectedGraph(skeleton = umg)
-        res = []
-        idx = 0
-
-
-        for edge in edges:
-            a, b = edge
-            weight = self.predict_proba(scale(df_data[a].as_matrix()), scale(df_data[b].as_matrix()),idx)
 
+        for (a, b), weight in zip(edges, self._predict_edges(df_data, edges, printout, resume, **kwargs)):
             if weight > 0:  # a causes b
                 graph.add(a, b, weight)
             else:
                 graph.add(b, a, abs(weight))
-            if printout is not None:
-                res.append([str(a) + '-' + str(b), weight])
-                DataFrame(res, columns=['SampleID', 'Predictions']).to_csv(
-                    printout, index=False)
-
-            idx += 1
 
         graph.remove_cycles()
         return graph
+
+    def _predict_edges(self, df_data, edges, printout=None, resume=False, **kwargs):
+        """ Predictions for the edges of a graph
+
+        :param df_data: dataset (Dataset or pandas.DataFrame, standardized once, see utils.Dataset)
+        :param edges: list of edges [a, b]
+        :param printout: print regularly predictions
+        :param resume: reuse the predictions of an existing printout file
+        :return: list of probabilities, in the order of the edges
+        :rtype: list
+        """
+
+        dataset = as_dataset(df_data)
+
+        def get_pair(i):
+            a, b = edges[i]
+            return dataset.column(a), dataset.column(b)
+
+        return self._predict_printout([str(a) + '-' + str(b) for a, b in edges], get_pair, printout, resume, **kwargs)
+
+    def _predict_printout(self, sample_ids, get_pair, printout=None, resume=False, **kwargs):
+        """ Predictions for a list of pairs, appended to the printout file as they complete
+
+        :param sample_ids: IDs of the pairs in the printout file
+        :param get_pair: function returning the (a, b) variables of the i-th pair
+        :param printout: print regularly predictions
+        :param resume: pairs whose ID is already in the printout file are not computed again
+        :param kwargs: cascade=(SETTINGS.cascade) orient the decisive pairs with cheap scores first (see screen_pairs)
+        :return: list of probabilities, in the order of sample_ids ; the positions of the pairs given to
+         predict_pairs are kept in self.model_positions
+        :rtype: list
+        """
+        pred = [None] * len(sample_ids)
+        writer = PredictionWriter(printout, resume) if printout is not None else None
+
+        try:
+            todo = []
+            for i, sample_id in enumerate(sample_ids):
+                if writer is not None and str(sample_id) in writer.done:
+                    pred[i] = writer.done[str(sample_id)]
+                else:
+                    todo.append(i)
+
+            if kwargs.get('cascade', SETTINGS.cascade) and todo:
+                pairs = [get_pair(i) for i in todo]
+                decided, remaining = self.screen_pairs(pairs, **kwargs)
+                for j, proba in decided.items():
+                    pred[todo[j]] = proba
+                    if writer is not None:
+                        writer.write(sample_ids[todo[j]], proba)
+                todo = [todo[j] for j in remaining]
+                pairs = [pairs[j] for j in remaining]
+            else:
+                pairs = (get_pair(i) for i in todo)
+
+            self.model_positions = todo
+            for j, proba in self.predict_pairs(pairs, **kwargs):
+                pred[todo[j]] = proba
+                if writer is not None:
+                    writer.write(sample_ids[todo[j]], proba)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        return pred
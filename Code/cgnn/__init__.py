@@ -6,6 +6,7 @@ from .GNN import GNN
 from .generators import __init__
 from .utils import Loss
 from .utils.Settings import SETTINGS
+from .utils.Log import enable_logging, add_json_sink
 
 
 __all__ = ['DirectedGraph', 'UndirectedGraph', 'CGNN', 'CGNN_confounders', 'GNN']
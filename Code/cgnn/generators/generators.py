@@ -2,15 +2,20 @@
 Author: Diviyan Kalainathan & Olivier Goudet
 Date : 30/06/17
 """
+import logging
+
 import numpy as np
 import tensorflow as tf
 from sklearn.linear_model import LassoLars
 from sklearn.svm import SVR
 
 from Code.cgnn.CGNN import CGNN_tf as CGNN
+from ..utils.Log import get_logger
 from ..utils.Loss import MMD_loss_tf as MMD
 from ..utils.Settings import SETTINGS
 
+logger = get_logger(__name__)
+
 
 def init(size):
     """ Initialize a random tensor, normal(0,SETTINGS.init_weights).
@@ -43,33 +48,29 @@ class FullGraphPolynomialModel_tf(object):
         generated_variables = {}
         theta_G = [alpha]
 
-        while len(generated_variables) < n_var:
-            for var in list_nodes:
-                # Check if all parents are generated
-                par = graph.get_parents(var)
+        # Parents are generated before their children
+        for var in graph.topological_order(list_nodes):
+            par = graph.get_parents(var)
 
-                if (var not in generated_variables and
-                        set(par).issubset(generated_variables)):
+            # Generate the variable
+            W_in = tf.Variable(init([int((len(par) + 2) * (len(par) + 1) / 2), 1]))
 
-                    # Generate the variable
-                    W_in = tf.Variable(init([int((len(par) + 2) * (len(par) + 1) / 2), 1]))
+            input_v = []
+            input_v.append(tf.ones([N, 1]))
+            for i in par:
+                input_v.append(generated_variables[i]/((len(par) + 2) * (len(par) + 1) / 2))
+                # Renormalize w/ number of inputs?
+            input_v.append(tf.random_normal([N, 1], mean=0, stddev=1))
 
-                    input_v = []
-                    input_v.append(tf.ones([N, 1]))
-                    for i in par:
-                        input_v.append(generated_variables[i]/((len(par) + 2) * (len(par) + 1) / 2))
-                        # Renormalize w/ number of inputs?
-                    input_v.append(tf.random_normal([N, 1], mean=0, stddev=1))
+            out_v = 0
+            cpt = 0
+            for i in range(len(par) + 2):
+                for j in range(i + 1, len(par) + 2):
+                    out_v += W_in[cpt] * tf.multiply(input_v[i], input_v[j])
+                    cpt += 1
 
-                    out_v = 0
-                    cpt = 0
-                    for i in range(len(par) + 2):
-                        for j in range(i + 1, len(par) + 2):
-                            out_v += W_in[cpt] * tf.multiply(input_v[i], input_v[j])
-                            cpt += 1
-
-                    generated_variables[var] = out_v
-                    theta_G.extend([W_in])
+            generated_variables[var] = out_v
+            theta_G.extend([W_in])
 
         listvariablegraph = []
         for var in list_nodes:
@@ -104,11 +105,9 @@ class FullGraphPolynomialModel_tf(object):
                 feed_dict={self.all_real_variables: data}
             )
 
-            if verbose:
-                if it % 10 == 0:
-                    print('Pair:{}, Run:{}, Iter:{}, score:{}'.
-                          format(self.idx, self.run,
-                                 it, G_dist_loss_xcausesy_curr))
+            if verbose and it % 10 == 0 and logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Pair:%s, Run:%s, Iter:%s, score:%s', self.idx, self.run,
+                             it, G_dist_loss_xcausesy_curr)
 
         return G_dist_loss_xcausesy_curr
 
@@ -128,7 +127,7 @@ class FullGraphPolynomialModel_tf(object):
                                                          self.all_generated_variables],
                                                         feed_dict={self.all_real_variables: data})
             if verbose:
-                print('Pair:{}, Run:{}, Iter:{}, score:{}'.format(self.idx, self.run, it, MMD_tr))
+                logger.debug('Pair:%s, Run:%s, Iter:%s, score:%s', self.idx, self.run, it, MMD_tr)
 
         tf.reset_default_graph()
 
@@ -153,7 +152,7 @@ def full_graph_polynomial_generator_tf(df_data, graph, idx=0, run=0, **kwargs):
     gpu_offset = kwargs.get('gpu_offset', SETTINGS.GPU_OFFSET)
 
     list_nodes = graph.get_list_nodes()
-    print(list_nodes)
+    logger.debug('Nodes : %s', list_nodes)
     data = df_data[list_nodes].as_matrix()
     data = data.astype('float32')
 
@@ -165,7 +164,7 @@ def full_graph_polynomial_generator_tf(df_data, graph, idx=0, run=0, **kwargs):
             if np.isfinite(loss):
                 return model.evaluate(data)
             else:
-                print('Has not converged, re-running graph inference')
+                logger.warning('Has not converged, re-running graph inference')
                 return full_graph_polynomial_generator_tf(df_data, graph, **kwargs)
 
     else:
@@ -174,7 +173,7 @@ def full_graph_polynomial_generator_tf(df_data, graph, idx=0, run=0, **kwargs):
         if np.isfinite(loss):
             return model.evaluate(data)
         else:
-            print('Has not converged, re-running graph inference')
+            logger.warning('Has not converged, re-running graph inference')
             return full_graph_polynomial_generator_tf(df_data, graph, **kwargs)
 
 
@@ -196,7 +195,7 @@ def CGNN_generator_tf(df_data, graph, idx=0, run=0, **kwargs):
     gpu_offset = kwargs.get('gpu_offset', SETTINGS.GPU_OFFSET)
 
     list_nodes = graph.get_list_nodes()
-    print(list_nodes)
+    logger.debug('Nodes : %s', list_nodes)
     data = df_data[list_nodes].as_matrix()
     data = data.astype('float32')
 
@@ -258,8 +257,8 @@ def polynomial_regressor(x, target, causes, fixed_noise=False, verbose=True, **k
         loss.backward()
         optimizer.step()
 
-        if verbose and epoch % 50 == 0:
-            print('Epoch : {} ; Loss: {}'.format(epoch, loss.data.numpy()))
+        if verbose and epoch % 50 == 0 and logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Epoch : %s ; Loss: %s', epoch, loss.data.numpy())
 
     return model(x_input, n_ex).data.numpy()
 
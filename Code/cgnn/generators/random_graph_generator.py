@@ -1,5 +1,6 @@
 from .functions_default import (noise, cause, effect, rand_bin)
 from ..utils.Graph import DirectedGraph
+from ..utils.Log import get_logger
 from random import shuffle
 from sklearn.preprocessing import scale
 import numpy.random as rd
@@ -7,6 +8,8 @@ import pandas as pd
 import numpy as np
 import operator as op
 
+logger = get_logger(__name__)
+
 
 def series_to_cepc_kag(A, B, idxpair):
     strA = ''
@@ -43,10 +46,10 @@ class RandomGraphGenerator:
         self.cat_data = None
         self.cat_var = None
 
-        print('Init OK')
+        logger.info('Init OK')
 
     def generate(self, gen_cat=True):
-        print('--Beginning Fast build--')
+        logger.info('--Beginning Fast build--')
         # Drawing causes
         self.causes = [i for i in range(np.random.randint(
             2, self.nodes / np.floor(np.sqrt(self.nodes))))]
@@ -61,8 +64,7 @@ class RandomGraphGenerator:
 
         links = []
         while generated_nodes < self.nodes:
-            print(
-                '--Generating nodes : {} out of ~{}'.format(generated_nodes, self.nodes))
+            logger.info('--Generating nodes : %s out of ~%s', generated_nodes, self.nodes)
             layer.append([])  # new layer
 
             num_nodes_layer = np.random.randint(2, len(layer[-2]) + 2)
@@ -103,15 +105,14 @@ class RandomGraphGenerator:
 
                 generated_nodes += 1
         self.result_links = pd.DataFrame(links, columns=["Cause", "Effect"])
-        print('--Dataset Generated--')
+        logger.info('--Dataset Generated--')
         if gen_cat:
-            print('--Converting variables to categorical--')
+            logger.info('--Converting variables to categorical--')
             actual_cat_rate = 0.0
             self.cat_var = []
             self.cat_data = self.data.copy()
             while actual_cat_rate < self.cat_rate:
-                print(
-                    '--Converting, Actual rate: {:3.3f}/{}--'.format(actual_cat_rate, self.cat_rate))
+                logger.info('--Converting, Actual rate: %.3f/%s--', actual_cat_rate, self.cat_rate)
                 var = np.random.randint(0, self.nodes)
                 while var in self.cat_var:
                     var = np.random.randint(0, self.nodes)
@@ -121,11 +122,11 @@ class RandomGraphGenerator:
                 actual_cat_rate = float(len(self.cat_var)) / self.nodes
 
             self.cat_var = pd.DataFrame(self.cat_var)
-        print('Build Directed Graph')
+        logger.info('Build Directed Graph')
         self.graph = DirectedGraph()
         self.graph.add_multiple_edges([list(i)+[1] for i in self.result_links.as_matrix()])
 
-        print('--Done !--')
+        logger.info('--Done !--')
         return self.get_data()
 
     def get_data(self):
@@ -134,14 +135,14 @@ class RandomGraphGenerator:
         try:
             return self.graph, self.data, self.cat_data, self.cat_var
         except NameError:
-            print('Please compute graph using .generate(), graph not build yet')
+            logger.error('Please compute graph using .generate(), graph not build yet')
             raise NameError
 
     def save_data(self, filename):
         try:
             self.result_links
         except NameError:
-            print('Please compute graph using .generate(), graph not build yet')
+            logger.error('Please compute graph using .generate(), graph not build yet')
             raise NameError
         self.result_links.to_csv(
             filename + '_target.csv', sep=',', index=False)
@@ -153,7 +154,7 @@ class RandomGraphGenerator:
                                 sep=',', index=False)
         except AttributeError:
             pass
-        print('Saved files : ' + filename)
+        logger.info('Saved files : %s', filename)
 
     def generate_pairs(self, num_pairs):
         pairs_df = pd.DataFrame()
@@ -184,6 +185,6 @@ class RandomGraphGenerator:
                          str(self.num_max_parents) +
                          '_N' + str(self.nodes) +
                          '_targets.csv', index=False)
-        print('Done!')
+        logger.info('Done!')
 
         return pairs_df, target_df
@@ -0,0 +1,80 @@
+"""
+Cheap pairwise scores used to orient the decisive pairs before the full pairwise models
+"""
+
+import numpy as np
+
+
+def stack_by_length(pairs):
+    """ Group the pairs with the same number of points
+
+    :param pairs: list of (a, b) variables
+    :return: iterator of (pair numbers, a, b), a and b being arrays of shape (nb pairs, N)
+    """
+    groups = {}
+    for i, (a, b) in enumerate(pairs):
+        groups.setdefault(np.size(a), []).append(i)
+    for idx in groups.values():
+        yield (idx, np.vstack([np.ravel(pairs[i][0]) for i in idx]),
+               np.vstack([np.ravel(pairs[i][1]) for i in idx]))
+
+
+def _entropy(x):
+    """ Spacing estimator of the entropy of each row of x, up to a constant depending on N """
+    d = np.diff(np.sort(x, axis=1), axis=1)
+    valid = d > 0
+    return np.sum(np.log(np.where(valid, d, 1.)), axis=1) / np.maximum(np.sum(valid, axis=1), 1)
+
+
+def entropy_score(a, b):
+    """ IGCI with a gaussian reference measure (standardized variables) : the cause has the highest entropy
+
+    :param a: array of shape (nb pairs, N)
+    :param b: array of shape (nb pairs, N)
+    :return: scores in [-1, 1] (Value : 1 if a->b and -1 if b->a)
+    """
+    return np.tanh(_entropy(a) - _entropy(b))
+
+
+def _residual_dependence(x, y, degree=3, nb_bins=10):
+    """ Dependence between x and the residuals of a polynomial regression of y on x, for each row :
+    spread of the mean and of the variance of the standardized residuals over quantile bins of x
+    """
+    V = np.stack([x ** k for k in range(degree + 1)], axis=2)
+    VtV = np.matmul(V.transpose(0, 2, 1), V) + 1e-6 * np.eye(degree + 1)
+    coefs = np.linalg.solve(VtV, np.matmul(V.transpose(0, 2, 1), y[:, :, np.newaxis]))
+    r = y - np.matmul(V, coefs)[:, :, 0]
+    r = (r - r.mean(axis=1, keepdims=True)) / (r.std(axis=1, keepdims=True) + 1e-12)
+
+    P, N = r.shape
+    size = N // nb_bins
+    bins = np.take_along_axis(r, np.argsort(x, axis=1), axis=1)[:, :size * nb_bins].reshape((P, nb_bins, size))
+    return bins.var(axis=2).std(axis=1) + np.abs(bins.mean(axis=2)).mean(axis=1)
+
+
+def residual_score(a, b):
+    """ Additive noise : the residuals of the regression on the cause are the least dependent on it
+
+    :param a: array of shape (nb pairs, N)
+    :param b: array of shape (nb pairs, N)
+    :return: scores in [-1, 1] (Value : 1 if a->b and -1 if b->a)
+    """
+    return np.tanh(_residual_dependence(b, a) - _residual_dependence(a, b))
+
+
+cascade_scores = {'entropy': entropy_score,
+                  'residual': residual_score}
+
+
+def cascade_score(name, pairs):
+    """ Compute a score of the cascade for all the pairs at once
+
+    :param name: name of the score (key of cascade_scores)
+    :param pairs: list of (a, b) variables
+    :return: scores in [-1, 1] (Value : 1 if a->b and -1 if b->a)
+    :rtype: numpy.ndarray
+    """
+    scores = np.empty(len(pairs))
+    for idx, a, b in stack_by_length(pairs):
+        scores[idx] = cascade_scores[name](a, b)
+    return scores
@@ -0,0 +1,149 @@
+"""
+Standardized datasets shared with the worker processes
+"""
+
+import os
+import tempfile
+
+import numpy as np
+from sklearn.preprocessing import scale
+
+_opened = {}
+_max_opened = 4
+
+
+class Dataset(object):
+    """ Standardized float32 matrix of the variables, stored column by column, and the index of their names.
+
+    Once shared (see share), the matrix is in a memory-mapped temporary file, in shared memory when
+    available : pickling the dataset only sends the name of the file and the index of the variables,
+    and each worker process maps the file once.
+    """
+
+    def __init__(self, values, columns, filename=None):
+        """ Init the dataset
+
+        :param values: matrix of the variables, or None if the matrix is in filename
+        :param columns: names of the variables
+        :param filename: file of the matrix if shared
+        """
+        self._values = values
+        self.columns = list(columns)
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.filename = filename
+
+    @classmethod
+    def from_frame(cls, df_data):
+        """ Standardize a dataset
+
+        :param df_data: dataset
+        :type df_data: pandas.DataFrame
+        :return: standardized dataset
+        :rtype: Dataset
+        """
+        values = scale(df_data.as_matrix().astype('float64'), copy=False)
+        return cls(np.asfortranarray(values, dtype='float32'), df_data.columns)
+
+    @property
+    def values(self):
+        if self._values is None:
+            self._values = open_shared_matrix(self.filename)
+        return self._values
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def column(self, name):
+        """ Standardized variable
+
+        :param name: name of the variable
+        :return: float32 vector (view on the matrix, no copy)
+        :rtype: numpy.ndarray
+        """
+        return self.values[:, self.index[name]]
+
+    def matrix(self, names):
+        """ Matrix of some variables
+
+        :param names: names of the variables, in the order of the columns of the matrix
+        :return: float32 matrix (copy)
+        :rtype: numpy.ndarray
+        """
+        return self.values[:, [self.index[name] for name in names]]
+
+    def share(self):
+        """ Write the matrix once to a memory-mapped temporary file, released by release
+
+        :return: the dataset
+        """
+        if self.filename is None:
+            folder = '/dev/shm' if os.path.isdir('/dev/shm') else None
+            fd, filename = tempfile.mkstemp(prefix='cgnn_data_', suffix='.npy', dir=folder)
+            os.close(fd)
+            shared = np.lib.format.open_memmap(filename, mode='w+', dtype='float32',
+                                               shape=self._values.shape, fortran_order=True)
+            shared[:] = self._values
+            shared.flush()
+            self.filename = filename
+        return self
+
+    def unshared(self):
+        """ Copy of the dataset that carries its matrix when pickled, for processes on other hosts
+
+        :rtype: Dataset
+        """
+        return Dataset(np.array(self.values, order='F'), self.columns)
+
+    def release(self):
+        """ Delete the file of a shared dataset """
+        if self.filename is not None:
+            _opened.pop(self.filename, None)
+            try:
+                os.remove(self.filename)
+            except OSError:
+                pass
+            self.filename = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.filename is not None:
+            state['_values'] = None
+        return state
+
+
+def open_shared_matrix(filename):
+    """ Matrix of a shared dataset, mapped at the first call in each process
+
+    :param filename: file of the matrix
+    :return: read-only memory-mapped matrix
+    :rtype: numpy.memmap
+    """
+    if filename not in _opened:
+        while len(_opened) >= _max_opened:
+            del _opened[next(iter(_opened))]
+        _opened[filename] = np.load(filename, mmap_mode='r')
+    return _opened[filename]
+
+
+def as_dataset(data):
+    """ Standardized dataset of the data, computed once : a Dataset is returned as is
+
+    :param data: Dataset or pandas.DataFrame
+    :rtype: Dataset
+    """
+    if isinstance(data, Dataset):
+        return data
+    return Dataset.from_frame(data)
+
+
+def data_matrix(data, names):
+    """ float32 matrix of some variables of a dataset
+
+    :param data: Dataset or pandas.DataFrame
+    :param names: names of the variables, in the order of the columns of the matrix
+    :rtype: numpy.ndarray
+    """
+    if isinstance(data, Dataset):
+        return data.matrix(names)
+    return data[names].as_matrix().astype('float32')
@@ -0,0 +1,403 @@
+"""
+Executors for the evaluations of the CGNN runs
+Local joblib execution, or a coordinator pushing tasks to worker processes through a queue server
+
+Usage of the coordinator with workers on the local host :
+
+    with QueueExecutor() as executor:
+        executor.start_local_workers(4)
+        CGNN(backend="TensorFlow").orient_directed_graph(data, dag, executor=executor)
+
+Workers on other hosts : create the coordinator with an address reachable from these hosts,
+e.g. QueueExecutor(address=('', 5000)), and start on each host
+    python -m cgnn.utils.Executor HOST 5000 AUTHKEY --local 4
+with AUTHKEY = executor.authkey.hex(). The messages of the queue server are pickles : only
+use it on a trusted network.
+"""
+
+import argparse
+import os
+import queue
+import socket
+import threading
+import time
+import traceback
+import uuid
+from multiprocessing import Process
+from multiprocessing.managers import BaseManager
+
+from joblib import Parallel, delayed
+
+from .Dataset import Dataset
+from .Graph import GraphDelta, add_shared_graph, has_shared_graph
+from .Log import get_logger, logging_config
+from .Settings import SETTINGS
+
+logger = get_logger(__name__)
+
+_tasks = queue.Queue()
+_results = queue.Queue()
+_store = {}
+
+
+def _get_tasks():
+    return _tasks
+
+
+def _get_results():
+    return _results
+
+
+def _get_store():
+    return _store
+
+
+class _QueueManager(BaseManager):
+    """ Server holding the task queue, the result queue and the shared objects (data, graphs) """
+    pass
+
+
+_QueueManager.register('get_tasks', callable=_get_tasks)
+_QueueManager.register('get_results', callable=_get_results)
+_QueueManager.register('get_store', callable=_get_store)
+
+
+class JoblibExecutor(object):
+    """ Default executor : runs are evaluated by joblib on the local host """
+
+    def __init__(self, nb_jobs=None):
+        """ Init the executor
+
+        :param nb_jobs: number of jobs (defaults to SETTINGS.NB_JOBS)
+        """
+        self.nb_jobs = nb_jobs if nb_jobs is not None else SETTINGS.NB_JOBS
+
+    def map(self, function, data, graph, idx, runs, **kwargs):
+        """ Evaluate function(data, graph, idx, run, **kwargs) for all runs
+
+        :param function: CGNN function (depending on the backend)
+        :param data: data
+        :param graph: graph to evaluate
+        :param idx: index of the evaluated graph (only for print)
+        :param runs: list of the runs
+        :return: list of the results, in the order of the runs
+        :rtype: list
+        """
+        return Parallel(n_jobs=self.nb_jobs)(delayed(function)(
+            data, graph, idx, run, **kwargs) for run in runs)
+
+
+class QueueExecutor(object):
+    """ Coordinator dispatching the runs to worker processes through a queue server
+
+    Workers (see run_worker) connect to the address of the coordinator, possibly from
+    other hosts, and can join or leave at any time : the runs taken by a worker that
+    stopped sending heartbeats are queued again. The data and the base graphs of the
+    GraphDelta are sent once to each worker.
+    """
+
+    def __init__(self, address=('127.0.0.1', 0), authkey=None, worker_timeout=60., timeout=None, poll=0.5):
+        """ Init the coordinator
+
+        :param address: (host, port) of the queue server ; port 0 picks a free port. Only local workers
+         can connect to the default address
+        :param authkey: authentication key shared with the workers (random if None)
+        :param worker_timeout: delay in seconds without heartbeat after which a worker is considered gone ;
+         map fails if no worker is alive during this delay
+        :param timeout: maximal duration in seconds of a call to map (None for no limit)
+        :param poll: delay in seconds between two checks of the workers
+        """
+        self.address = address
+        self.authkey = authkey if authkey is not None else os.urandom(16)
+        self.worker_timeout = worker_timeout
+        self.timeout = timeout
+        self.poll = poll
+        self.workers = {}
+        self._manager = None
+        self._batch = 0
+        self._published = {}
+        self._local_workers = []
+
+    def start(self):
+        """ Start the queue server
+
+        :return: the executor
+        """
+        self._manager = _QueueManager(address=self.address, authkey=self.authkey)
+        self._manager.start()
+        self.address = self._manager.address
+        self._tasks = self._manager.get_tasks()
+        self._results = self._manager.get_results()
+        self._store = self._manager.get_store()
+        return self
+
+    def close(self):
+        """ Stop the local workers and the queue server """
+        if self._manager is None:
+            return
+        for _ in self._local_workers:
+            self._tasks.put(None)
+        for process in self._local_workers:
+            process.join(self.worker_timeout)
+        self._local_workers = []
+        self._manager.shutdown()
+        self._manager = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start_local_workers(self, nb_workers):
+        """ Start worker processes on the local host
+
+        :param nb_workers: number of workers
+        :return: list of the worker processes
+        :rtype: list
+        """
+        address = ('127.0.0.1', self.address[1])
+        processes = [Process(target=run_worker, args=(address, self.authkey), daemon=True)
+                     for _ in range(nb_workers)]
+        for process in processes:
+            process.start()
+        self._local_workers.extend(processes)
+        return processes
+
+    def _publish(self, obj, key=None):
+        """ Send an object once to the queue server
+
+        :param obj: object to share with the workers
+        :param key: key of the object (generated if None)
+        :return: key of the object in the store
+        """
+        if id(obj) in self._published:
+            return self._published[id(obj)][0]
+        key = key if key is not None else uuid.uuid4().hex
+        # The workers may be on other hosts, without access to the file of a shared dataset
+        self._store.update({key: obj.unshared() if isinstance(obj, Dataset) else obj})
+        # Keep a reference on obj so that its id is not reused
+        self._published[id(obj)] = (key, obj)
+        return key
+
+    def _unpublish(self, obj):
+        key, _ = self._published.pop(id(obj))
+        self._store.pop(key, None)
+
+    def map(self, function, data, graph, idx, runs, **kwargs):
+        """ Evaluate function(data, graph, idx, run, **kwargs) for all runs on the workers
+
+        :param function: CGNN function (depending on the backend), importable by the workers
+        :param data: data
+        :param graph: graph to evaluate
+        :param idx: index of the evaluated graph (only for print)
+        :param runs: list of the runs
+        :return: list of the results, in the order of the runs
+        :rtype: list
+        """
+        if self._manager is None:
+            self.start()
+        data_key = self._publish(data)
+        if isinstance(graph, GraphDelta) and graph.key is not None:
+            # Only the current base graph is kept on the server
+            graph_key = 'graph:' + graph.key
+            for key, obj in list(self._published.values()):
+                if key.startswith('graph:') and key != graph_key:
+                    self._unpublish(obj)
+            self._publish(graph.base, graph_key)
+
+        self._batch += 1
+        self._store.update({'batch': self._batch})
+        tasks = {}
+        for run in runs:
+            tasks[run] = (self._batch, run, function, data_key, graph, idx, kwargs)
+            self._tasks.put(tasks[run])
+
+        try:
+            results = self._wait(tasks)
+        except BaseException:
+            self._cancel()
+            raise
+        return [results[run] for run in runs]
+
+    def _wait(self, tasks):
+        """ Collect the results of the tasks of the current batch
+
+        :param tasks: tasks of the batch, by run
+        :return: results, by run
+        :rtype: dict
+        """
+        start = last_alive = time.time()
+        results = {}
+        leases = {}
+        # Runs neither queued, nor leased, nor done : taken by a worker that died before leasing them
+        unleased_since = {}
+        while len(results) < len(tasks):
+            try:
+                message = self._results.get(timeout=self.poll)
+            except queue.Empty:
+                message = None
+
+            now = time.time()
+            if message is not None:
+                kind, worker = message[:2]
+                self.workers[worker] = now
+                if kind != 'alive' and message[2] == self._batch:
+                    run = message[3]
+                    if kind == 'taken':
+                        leases[run] = worker
+                    elif kind == 'done' and run not in results:
+                        results[run] = message[4]
+                    elif kind == 'error':
+                        raise RuntimeError('Run {} failed on worker {}:\n{}'.format(run, worker, message[4]))
+
+            for run, worker in list(leases.items()):
+                if run not in results and now - self.workers[worker] > self.worker_timeout:
+                    logger.warning('Worker %s lost, run %s queued again', worker, run)
+                    del leases[run]
+                    self._tasks.put(tasks[run])
+
+            if self._tasks.qsize() == 0:
+                for run in tasks:
+                    if run in results or run in leases:
+                        unleased_since.pop(run, None)
+                    elif now - unleased_since.setdefault(run, now) > self.worker_timeout:
+                        logger.warning('Run %s lost before being leased, queued again', run)
+                        del unleased_since[run]
+                        self._tasks.put(tasks[run])
+            else:
+                unleased_since.clear()
+
+            if any(now - seen <= self.worker_timeout for seen in self.workers.values()):
+                last_alive = now
+            elif now - last_alive > self.worker_timeout:
+                raise RuntimeError('No worker alive for {} s, {} runs pending'.format(
+                    self.worker_timeout, len(tasks) - len(results)))
+            if self.timeout is not None and now - start > self.timeout:
+                raise RuntimeError('Batch not completed after {} s, {} runs pending'.format(
+                    self.timeout, len(tasks) - len(results)))
+        return results
+
+    def _cancel(self):
+        """ Cancel the current batch : its queued tasks are removed, and the workers skip the ones they get """
+        self._store.update({'batch': None})
+        try:
+            while True:
+                self._tasks.get_nowait()
+        except queue.Empty:
+            pass
+
+
+def run_worker(address, authkey, heartbeat=5.):
+    """ Evaluate the tasks of a QueueExecutor until it is closed
+
+    :param address: (host, port) of the coordinator
+    :param authkey: authentication key of the coordinator (QueueExecutor.authkey)
+    :param heartbeat: delay in seconds between two heartbeats
+    """
+    manager = _QueueManager(address=tuple(address), authkey=authkey)
+    manager.connect()
+    tasks = manager.get_tasks()
+    results = manager.get_results()
+    store = manager.get_store()
+    worker = '{}:{}'.format(socket.gethostname(), os.getpid())
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(heartbeat):
+            try:
+                results.put(('alive', worker))
+            except (EOFError, OSError):
+                return
+
+    threading.Thread(target=beat, daemon=True).start()
+    data_cache = {}
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            batch, run, function, data_key, graph, idx, kwargs = task
+            if store.get('batch') != batch:
+                continue  # Cancelled batch
+            results.put(('taken', worker, batch, run))
+            try:
+                if data_key not in data_cache:
+                    data_cache = {data_key: _get_published(store, data_key)}
+                if (isinstance(graph, GraphDelta) and graph.key is not None
+                        and not has_shared_graph(graph.key)):
+                    add_shared_graph(graph.key, _get_published(store, 'graph:' + graph.key))
+                value = function(data_cache[data_key], graph, idx, run, **kwargs)
+                results.put(('done', worker, batch, run, value))
+            except Exception:
+                results.put(('error', worker, batch, run, traceback.format_exc()))
+    except (EOFError, OSError):
+        pass  # Coordinator closed
+    finally:
+        stop.set()
+
+
+def _get_published(store, key):
+    """ Object published by the coordinator
+
+    :param store: store of the queue server
+    :param key: key of the object
+    :return: object
+    """
+    obj = store.get(key)
+    if obj is None:
+        raise KeyError('Object {} not published by the coordinator'.format(key))
+    return obj
+
+
+def evaluate_runs(function, data, graph, idx, **kwargs):
+    """ Evaluate nb_runs runs of a graph with the executor given in kwargs
+
+    :param function: CGNN function (depending on the backend)
+    :param data: data
+    :param graph: graph to evaluate
+    :param idx: index of the evaluated graph (only for print)
+    :param kwargs: executor=(None) executor of the runs ; JoblibExecutor(nb_jobs) if None
+    :param kwargs: nb_jobs=(SETTINGS.NB_JOBS) number of jobs
+    :param kwargs: nb_runs=(SETTINGS.NB_RUNS) number of runs, of different evaluations
+    :param kwargs: profiler=(None) Profiler collecting the records of the runs (see utils.Profiler)
+    :return: list of the results of the runs
+    :rtype: list
+    """
+    nb_runs = kwargs.get("nb_runs", SETTINGS.NB_RUNS)
+    executor = kwargs.get("executor")
+    profiler = kwargs.get("profiler")
+    if executor is None:
+        executor = JoblibExecutor(kwargs.get("nb_jobs", SETTINGS.NB_JOBS))
+    job_kwargs = {k: v for k, v in kwargs.items() if k not in ("executor", "profiler")}
+    job_kwargs['log_config'] = logging_config()
+    if profiler is None:
+        return executor.map(function, data, graph, idx, range(nb_runs), **job_kwargs)
+
+    job_kwargs['profile_runs'] = True
+    start = time.time()
+    results = executor.map(function, data, graph, idx, range(nb_runs), **job_kwargs)
+    profiler.add_candidate(idx, results, time.time() - start)
+    return results
+
+
+def main(argv=None):
+    """ Start workers of a QueueExecutor : python -m cgnn.utils.Executor HOST PORT AUTHKEY [--local N] """
+    parser = argparse.ArgumentParser(description='Workers of a CGNN QueueExecutor')
+    parser.add_argument('host', help='host of the coordinator')
+    parser.add_argument('port', type=int, help='port of the coordinator')
+    parser.add_argument('authkey', help='authentication key of the coordinator, in hexadecimal (authkey.hex())')
+    parser.add_argument('--local', type=int, default=1, metavar='N', help='number of worker processes on this host')
+    args = parser.parse_args(argv)
+
+    address, authkey = (args.host, args.port), bytes.fromhex(args.authkey)
+    processes = [Process(target=run_worker, args=(address, authkey)) for _ in range(args.local)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Canonical fingerprints of the edge sets of graphs, for the deduplication of the candidate graphs
+Nodes are interned as integer ids by a NodeIndex, and the fingerprint of an edge set is the XOR of
+the Zobrist keys of its edges.
+Only the fingerprints use the integer ids : DirectedGraph and UndirectedGraph keep their adjacency
+dicts, on which the topological order and the parents are maintained. The candidate graphs of the
+searches are not copied but are GraphDelta views of the current graph (see utils.Graph.GraphDelta),
+whose fingerprint is derived from the fingerprint of the base graph in O(number of moves)
+"""
+
+import numpy as np
+
+
+class NodeIndex(object):
+    """ Interned node names : each name gets an integer id, in the order of first use """
+    __slots__ = ('names', 'ids')
+
+    def __init__(self, names=()):
+        self.names = []
+        self.ids = {}
+        for name in names:
+            self.id(name)
+
+    def id(self, name):
+        """ Id of a node, assigned at its first use
+
+        :param name: name of the node
+        :rtype: int
+        """
+        node_id = self.ids.get(name)
+        if node_id is None:
+            node_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return node_id
+
+    def __len__(self):
+        return len(self.names)
+
+    def __deepcopy__(self, memo):
+        # Ids are never reassigned : copies of graphs share the index of their fingerprints
+        return self
+
+
+# Index used when none is given : fingerprints are comparable within a process
+default_index = NodeIndex()
+
+
+def edge_keys(src, dst):
+    """ Zobrist keys of edges : 64-bit pseudo-random values of the (src, dst) id pairs (splitmix64)
+
+    :param src: ids of the causes
+    :param dst: ids of the effects
+    :rtype: numpy.ndarray of uint64
+    """
+    x = (np.asarray(src, dtype=np.uint64) << np.uint64(32)) | np.asarray(dst, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def xor_fingerprint(src, dst, directed=True):
+    """ Fingerprint of an edge set : XOR of the keys of its edges, independent of their order.
+    Toggling an edge changes the fingerprint by the key of this edge only
+
+    :param src: ids of the causes
+    :param dst: ids of the effects
+    :param directed: if False, (i, j) and (j, i) are the same edge
+    :rtype: int
+    """
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    if not directed:
+        src, dst = np.minimum(src, dst), np.maximum(src, dst)
+    if len(src) == 0:
+        return 0
+    return int(np.bitwise_xor.reduce(edge_keys(src, dst)))
+
+
+def edge_key(index, node1, node2, directed=True):
+    """ Zobrist key of a single edge
+
+    :param index: NodeIndex
+    :param node1: cause of the edge
+    :param node2: effect of the edge
+    :param directed: if False, (node1, node2) and (node2, node1) are the same edge
+    :rtype: int
+    """
+    return xor_fingerprint([index.id(node1)], [index.id(node2)], directed)
+
@@ -4,52 +4,300 @@ Author: Diviyan Kalainathan
 Date : 2/06/17
 
 """
+import csv
+import hashlib
+import json
+import os
+import time
 from pandas import DataFrame, read_csv
-from numpy import array
-from sklearn.preprocessing import scale as scaler
+from numpy import concatenate, cumsum, float32, fromstring, int64, memmap
 
 
-def CCEPC_PairsFileReader(filename, scale=True):
+def _parse_field(field):
+    """ Parse a space-separated CCEPC field in one call to numpy
+
+    :param field: values separated by spaces, possibly with leading or trailing spaces
+    :type field: str
+    :return: values
+    :rtype: numpy.ndarray
+    """
+    return fromstring(field, sep=" ")
+
+
+def _standardize(x):
+    """ Centered and unit-variance copy of x, as sklearn.preprocessing.scale without its input checks """
+    x = x - x.mean()
+    std = x.std()
+    if std > 0:
+        x /= std
+    return x
+
+
+def CCEPC_PairsFileIterator(filename, scale=True, chunksize=1000):
+    """ Read a ChaLearn Cause effect pairs challenge file pair by pair, without loading the whole file
+
+    :param filename:
+    :type filename: str
+    :param scale: scale each variable
+    :param chunksize: number of rows read from the file at once
+    :return: iterator of (SampleID, a (numpy.ndarray), b (numpy.ndarray))
+    """
+    for chunk in read_csv(filename, usecols=['SampleID', 'A', 'B'], dtype=str, chunksize=chunksize):
+        for sample_id, a, b in zip(chunk['SampleID'], chunk['A'], chunk['B']):
+            a = _parse_field(a)
+            b = _parse_field(b)
+            if scale:
+                a = _standardize(a)
+                b = _standardize(b)
+            yield sample_id, a, b
+
+
+def CCEPC_PairsFileReader(filename, scale=True, chunksize=1000):
     """ Converts a ChaLearn Cause effect pairs challenge format into numpy.ndarray
 
     :param filename:
     :type filename: str
+    :param scale: scale each variable
+    :param chunksize: number of rows read from the file at once (see CCEPC_PairsFileIterator)
     :return: Dataframe composed of (SampleID, a (numpy.ndarray) , b (numpy.ndarray))
     :rtype: pandas.DataFrame
     """
+    return DataFrame(list(CCEPC_PairsFileIterator(filename, scale, chunksize)), columns=['SampleID', 'A', 'B'])
+
+
+def file_hash(filename, block_size=1 << 20):
+    """ Hash of the content of a file, read by blocks
+
+    :param filename: path of the file
+    :param block_size: size in bytes of the blocks
+    :return: hexadecimal digest
+    :rtype: str
+    """
+    h = hashlib.blake2b()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _cache_meta(cache):
+    """ Metadata of a cache, None if the cache does not exist or was not completely written """
+    try:
+        with open(os.path.join(cache, 'meta.json')) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def _start_build(cache):
+    """ Create the directory of a cache, and invalidate the previous cache by removing its metadata
+    before any of its files is replaced """
+    os.makedirs(cache, exist_ok=True)
+    try:
+        os.remove(os.path.join(cache, 'meta.json'))
+    except OSError:
+        pass
+
+
+def _tmp_path(cache, name):
+    """ Temporary path of a file of a cache, moved to its final path by _commit """
+    return os.path.join(cache, name + '.tmp')
+
+
+def _commit(cache, names, meta):
+    """ Move the files written to their temporary paths to their final paths, then write the metadata
+    last : a cache without metadata is incomplete """
+    for name in names:
+        os.replace(_tmp_path(cache, name), os.path.join(cache, name))
+    with open(_tmp_path(cache, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    os.replace(_tmp_path(cache, 'meta.json'), os.path.join(cache, 'meta.json'))
+
+
+def _check_source(meta, kind, source):
+    """ Raise ValueError if the cache is not of this kind or does not match the source file """
+    if meta is None or meta['kind'] != kind:
+        raise ValueError('No {} cache found'.format(kind))
+    if source is not None and file_hash(source) != meta['hash']:
+        raise ValueError('The cache does not match the source file {}'.format(source))
+
+
+def build_numdata_cache(filename, cache=None):
+    """ Convert a numdata CSV file (one column per variable) into a binary cache :
+    a float32 matrix stored column by column, memory-mapped by load_numdata_cache
+
+    :param filename: path of the CSV file
+    :param cache: directory of the cache (defaults to filename + '.cache')
+    :return: directory of the cache
+    :rtype: str
+    """
+    cache = cache if cache is not None else filename + '.cache'
+    _start_build(cache)
+    source_hash = file_hash(filename)
+    data = read_csv(filename, dtype=float32)
+    # The transpose in row-major order is the matrix in column-major order
+    data.values.T.tofile(_tmp_path(cache, 'values.f32'))
+    _commit(cache, ['values.f32'], {'kind': 'numdata', 'hash': source_hash, 'shape': list(data.shape),
+                                    'columns': [str(c) for c in data.columns]})
+    return cache
+
+
+def load_numdata_cache(cache, source=None):
+    """ Dataset of a numdata cache, backed by the memory-mapped file (nothing is parsed or copied)
+
+    :param cache: directory of the cache
+    :param source: if not None, path of the CSV file the cache has to match
+    :return: dataset, accepted by the graph models
+    :rtype: pandas.DataFrame
+    """
+    meta = _cache_meta(cache)
+    _check_source(meta, 'numdata', source)
+    values = memmap(os.path.join(cache, 'values.f32'), dtype=float32, mode='r',
+                    shape=tuple(meta['shape']), order='F')
+    return DataFrame(values, columns=meta['columns'], copy=False)
+
+
+def read_numdata(filename, cache=None):
+    """ Dataset of a numdata CSV file, through its binary cache, built at the first call
+    or when the file changed
+
+    :param filename: path of the CSV file
+    :param cache: directory of the cache (defaults to filename + '.cache')
+    :return: dataset, accepted by the graph models
+    :rtype: pandas.DataFrame
+    """
+    cache = cache if cache is not None else filename + '.cache'
+    try:
+        return load_numdata_cache(cache, filename)
+    except ValueError:
+        return load_numdata_cache(build_numdata_cache(filename, cache))
+
+
+def build_pairs_cache(filename, cache=None, chunksize=1000):
+    """ Convert a ChaLearn Cause effect pairs challenge file into a binary cache : the unscaled
+    variables of all the pairs concatenated in a float32 buffer, and the offsets of the variables.
+    The file is read in chunks (see CCEPC_PairsFileIterator)
+
+    :param filename: path of the pairs file
+    :param cache: directory of the cache (defaults to filename + '.cache')
+    :param chunksize: number of rows read from the file at once
+    :return: directory of the cache
+    :rtype: str
+    """
+    cache = cache if cache is not None else filename + '.cache'
+    _start_build(cache)
+    source_hash = file_hash(filename)
+    sample_ids = []
+    lengths = [0]
+
+    with open(_tmp_path(cache, 'values.f32'), 'wb') as f:
+        for sample_id, a, b in CCEPC_PairsFileIterator(filename, scale=False, chunksize=chunksize):
+            sample_ids.append(sample_id)
+            lengths.extend((len(a), len(b)))
+            concatenate((a, b)).astype(float32).tofile(f)
+
+    # Variable k (a of pair k // 2 if k is even, else b) is values[offsets[k]:offsets[k + 1]]
+    cumsum(lengths, dtype=int64).tofile(_tmp_path(cache, 'offsets.i8'))
+    _commit(cache, ['values.f32', 'offsets.i8'], {'kind': 'pairs', 'hash': source_hash, 'sample_ids': sample_ids})
+    return cache
+
+
+def load_pairs_cache(cache, source=None):
+    """ Pairs of a pairs cache ; the variables are views on the memory-mapped buffer
+
+    :param cache: directory of the cache
+    :param source: if not None, path of the pairs file the cache has to match
+    :return: Dataframe composed of (SampleID, a (numpy.ndarray) , b (numpy.ndarray)), accepted by predict_dataset ;
+     the variables are not scaled
+    :rtype: pandas.DataFrame
+    """
+    meta = _cache_meta(cache)
+    _check_source(meta, 'pairs', source)
+    offsets = memmap(os.path.join(cache, 'offsets.i8'), dtype=int64, mode='r').tolist()
+    values = memmap(os.path.join(cache, 'values.f32'), dtype=float32, mode='r') if offsets[-1] else []
+    variables = [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    return DataFrame({'SampleID': meta['sample_ids'], 'A': variables[::2], 'B': variables[1::2]},
+                     columns=['SampleID', 'A', 'B'])
 
-    def convert_row(row, scale):
-        """ Convert a CCEPC row into numpy.ndarrays
 
-        :param row:
-        :type row: pandas.Series
-        :return: tuple of sample ID and the converted data into numpy.ndarrays
-        :rtype: tuple
+def read_pairs(filename, cache=None):
+    """ Pairs of a ChaLearn Cause effect pairs challenge file, through its binary cache,
+    built at the first call or when the file changed
+
+    :param filename: path of the pairs file
+    :param cache: directory of the cache (defaults to filename + '.cache')
+    :return: Dataframe composed of (SampleID, a (numpy.ndarray) , b (numpy.ndarray)) ; the variables are not scaled
+    :rtype: pandas.DataFrame
+    """
+    cache = cache if cache is not None else filename + '.cache'
+    try:
+        return load_pairs_cache(cache, filename)
+    except ValueError:
+        return load_pairs_cache(build_pairs_cache(filename, cache))
+
+
+class PredictionWriter(object):
+    """ Append-only CSV writer of the predictions, one row per pair or edge.
+    Rows are flushed at each write and synced to the disk at most every fsync_interval seconds.
+    In resume mode, the rows of an existing file are kept and can be skipped by the caller
+    """
+
+    def __init__(self, filename, resume=False, fsync_interval=10., columns=('SampleID', 'Predictions')):
+        """ Open the printout file
+
+        :param filename: path of the printout file
+        :param resume: keep the rows of an existing file, available in self.done
+        :param fsync_interval: minimal delay in seconds between two syncs to the disk
+        :param columns: header of the file
         """
-        a = row["A"].split(" ")
-        b = row["B"].split(" ")
+        self.filename = filename
+        self.fsync_interval = fsync_interval
+        self.done = {}
 
-        if a[0] == "":
-            a.pop(0)
-            b.pop(0)
+        if resume and os.path.isfile(filename) and os.path.getsize(filename) > 0:
+            with open(filename, 'r+') as f:
+                content = f.read()
+                # Drop a last row cut by an interruption
+                end = content.rfind('\n') + 1
+                if end < len(content):
+                    f.seek(end)
+                    f.truncate()
+            for row in list(csv.reader(content[:end].splitlines()))[1:]:
+                self.done[row[0]] = float(row[1])
+            self._file = open(filename, 'a', newline='')
+            self._writer = csv.writer(self._file, lineterminator='\n')
+        else:
+            self._file = open(filename, 'w', newline='')
+            self._writer = csv.writer(self._file, lineterminator='\n')
+            self._writer.writerow(columns)
+        self._last_sync = time.time()
 
-        if a[-1] == "":
-            a.pop(-1)
-            b.pop(-1)
+    def write(self, sample_id, prediction):
+        """ Append a prediction
 
-        a = array([float(i) for i in a])
-        b = array([float(i) for i in b])
-        if scale:
-            a = scaler(a)
-            b = scaler(b)
-        return row['SampleID'], a, b
+        :param sample_id: ID of the pair or edge
+        :param prediction: prediction
+        """
+        self._writer.writerow([sample_id, prediction])
+        self.done[str(sample_id)] = prediction
+        self._file.flush()
+        if time.time() - self._last_sync >= self.fsync_interval:
+            self.sync()
 
-    data = read_csv(filename)
-    conv_data = []
+    def sync(self):
+        """ Force the written rows to the disk """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = time.time()
 
-    for idx, row in data.iterrows():
-        conv_data.append(convert_row(row, scale))
-    df = DataFrame(conv_data, columns=['SampleID', 'A', 'B'])
-    return df
+    def close(self):
+        """ Sync and close the file """
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
 
+    def __enter__(self):
+        return self
 
+    def __exit__(self, *args):
+        self.close()
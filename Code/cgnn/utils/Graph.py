@@ -5,10 +5,18 @@ Author : Diviyan Kalainathan & Olivier Goudet
 Date : 21/04/2017
 """
 
+import heapq
+import os
+import pickle
+import tempfile
 import numpy as np
-from copy import deepcopy
+import scipy.sparse
 from collections import defaultdict
 import pandas as pd
+from .Fingerprint import default_index, edge_key, xor_fingerprint
+from .Log import get_logger
+
+logger = get_logger(__name__)
 
 def list_to_dict(links):
     """ Create a dict out of a list of links
@@ -26,26 +34,271 @@ def list_to_dict(links):
     return dic
 
 
+def dict_is_cyclic(g):
+    """ Check if a graph represented as a dict has a cycle
+
+    :param g: dictionary mapping vertices to iterables of neighbouring vertices
+    :return: True if the directed graph is cyclic
+    :rtype: bool
+    """
+    path = set()
+    visited = set()
+
+    def visit(vertex):
+        if vertex in visited:
+            return False
+        visited.add(vertex)
+        path.add(vertex)
+        for neighbour in g.get(vertex, ()):
+            if neighbour in path or visit(neighbour):
+                return True
+        path.remove(vertex)
+        return False
+
+    return any(visit(v) for v in list(g))
+
+
+def dict_topological_order(g):
+    """ Topological order of a graph represented as a dict (Kahn's algorithm)
+
+    :param g: dictionary mapping vertices to lists of neighbouring vertices, with an entry for every vertex
+    :return: list of the vertices, causes before effects ; None if the graph is cyclic
+    :rtype: list
+    """
+    in_degree = {node: 0 for node in g}
+    for node in g:
+        for child in g[node]:
+            in_degree[child] += 1
+    order = [node for node in g if in_degree[node] == 0]
+    for node in order:
+        for child in g[node]:
+            in_degree[child] -= 1
+            if in_degree[child] == 0:
+                order.append(child)
+    return order if len(order) == len(g) else None
+
+
+def dict_strongly_connected_components(g):
+    """ Strongly connected components of a graph represented as a dict (iterative Tarjan's algorithm)
+
+    :param g: dictionary mapping vertices to iterables of neighbouring vertices
+    :return: list of the components (lists of vertices), effects before causes
+    :rtype: list
+    """
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for root in g:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(g.get(root, ())))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(g.get(child, ()))))
+                    break
+                elif child in on_stack:
+                    low[node] = min(low[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        vertex = stack.pop()
+                        on_stack.discard(vertex)
+                        component.append(vertex)
+                        if vertex == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def greedy_feedback_order(nodes, weights):
+    """ Vertex order of the greedy feedback arc set heuristic of Eades, Lin & Smyth, weighted :
+    sinks are placed last, sources first, and otherwise the vertex with the largest difference
+    between the weights of its outgoing and incoming edges is placed first. The edges going
+    backwards in this order form a feedback arc set of low weight. Runs in O(E log V)
+
+    :param nodes: vertices of the graph
+    :param weights: dict of dicts, weights[i][j] being the weight of i -> j ; edges to other vertices are ignored
+    :return: order of the vertices
+    :rtype: list
+    """
+    nodes = list(nodes)
+    in_graph = set(nodes)
+    children = {i: {j: w for j, w in weights.get(i, {}).items() if j in in_graph} for i in nodes}
+    parents = {i: {} for i in nodes}
+    for i in nodes:
+        for j, w in children[i].items():
+            parents[j][i] = w
+    rank = {i: k for k, i in enumerate(nodes)}
+    delta = {i: sum(children[i].values()) - sum(parents[i].values()) for i in nodes}
+    nb_children = {i: len(children[i]) for i in nodes}
+    nb_parents = {i: len(parents[i]) for i in nodes}
+
+    sinks = [i for i in nodes if nb_children[i] == 0]
+    sources = [i for i in nodes if nb_parents[i] == 0]
+    # Lazy max-heap on delta : outdated entries are skipped
+    heap = [(-delta[i], rank[i], i) for i in nodes]
+    heapq.heapify(heap)
+    removed = set()
+    head, tail = [], []
+
+    def remove(node):
+        removed.add(node)
+        for child, w in children[node].items():
+            if child not in removed:
+                nb_parents[child] -= 1
+                delta[child] += w
+                if nb_parents[child] == 0:
+                    sources.append(child)
+                heapq.heappush(heap, (-delta[child], rank[child], child))
+        for parent, w in parents[node].items():
+            if parent not in removed:
+                nb_children[parent] -= 1
+                delta[parent] -= w
+                if nb_children[parent] == 0:
+                    sinks.append(parent)
+                heapq.heappush(heap, (-delta[parent], rank[parent], parent))
+
+    while len(removed) < len(nodes):
+        if sinks:
+            node = sinks.pop()
+            if node not in removed:
+                remove(node)
+                tail.append(node)
+        elif sources:
+            node = sources.pop()
+            if node not in removed:
+                remove(node)
+                head.append(node)
+        else:
+            key, _, node = heapq.heappop(heap)
+            if node not in removed and -key == delta[node]:
+                remove(node)
+                head.append(node)
+
+    return head + tail[::-1]
+
+
+def add_isolated_nodes(order, nodes):
+    """ Complete a topological order with nodes without edges, placed first
+
+    :param order: topological order of the nodes of a graph
+    :param nodes: nodes to include, possibly absent from the graph
+    :return: topological order
+    :rtype: list
+    """
+    if nodes is None:
+        return order
+    in_graph = set(order)
+    return [node for node in nodes if node not in in_graph] + order
+
+
+def dict_cycles(g):
+    """Return the list of cycles of a graph represented as a dict
+
+    :param g: dictionary mapping vertices to iterables of neighbouring vertices
+    :return: Cycles in the graph
+    :rtype: list
+    """
+
+    def dfs(graph, start, end):
+        fringe = [(start, [])]
+        while fringe:
+            state, path = fringe.pop()
+            if path and state == end:
+                yield path
+                continue
+            for next_state in graph[state]:
+                if next_state in path:
+                    continue
+                fringe.append((next_state, path + [next_state]))
+
+    return [[node] + path for node in g for path in dfs(g, node, node) if path]
+
+
+def order_edges(list_edges, weights, order_by_weight=True, descending=False, return_weights=True):
+    """ Order a list of edges according to their weights
+
+    :param list_edges: List of edges [cause, effect]
+    :param weights: weights of the edges
+    :param order_by_weight: List of edges will be ordered by weight values
+    :param descending: order elements by decreasing weights
+    :param return_weights: return the list of weights
+    :return: List of edges and their weights
+    :rtype: list
+    """
+    if order_by_weight and list_edges:
+        weights, list_edges = (list(i) for i
+                               in zip(*sorted(zip(weights, list_edges),
+                                              reverse=descending)))
+    if return_weights:
+        return [[edge[0], edge[1], weight] for edge, weight in zip(list_edges, weights)]
+    else:
+        return list_edges
+
+
 class Graph(object):
     """ Base class for Graph structure"""
+    _directed = True
 
     def __init__(self, df=None, adjacency_matrix=False):
         """ Create a new graph structure"""
         self._graph = defaultdict(dict)
-        connections = []
         if df is not None:
             if adjacency_matrix:
-                data = df.as_matrix()
-                col = df.columns
-                for i in range(data.shape[0]):
-                    for j in range(data.shape[0]):
-                        if i != j and data[i, j] > 0.001:
-                            connections.append([col[i], col[j], data[i, j]])
+                self.add_adjacency_matrix(df.as_matrix(), df.columns)
             else:
-                for idx, row in df.iterrows():
-                    connections.append(row)
+                # Rows (cause, effect[, weight])
+                self.add_multiple_edges(df.itertuples(index=False, name=None))
+
+    @classmethod
+    def from_adjacency_matrix(cls, matrix, nodes, threshold=0.001):
+        """ Create a graph from an adjacency matrix
 
-            self.add_multiple_edges(connections)
+        :param matrix: numpy.ndarray or scipy.sparse matrix (size : Nodes x Nodes), matrix[i, j] being the weight of i -> j
+        :param nodes: list of nodes, in the order of the rows and columns of the matrix
+        :param threshold: cells whose value is not greater than threshold are not edges
+        :return: new graph
+        """
+        graph = cls()
+        graph.add_adjacency_matrix(matrix, nodes, threshold)
+        return graph
+
+    def add_adjacency_matrix(self, matrix, nodes, threshold=0.001):
+        """ Add the edges of an adjacency matrix, found in one pass over its cells (or its stored values if sparse)
+
+        :param matrix: numpy.ndarray or scipy.sparse matrix (size : Nodes x Nodes), matrix[i, j] being the weight of i -> j
+        :param nodes: list of nodes, in the order of the rows and columns of the matrix
+        :param threshold: cells whose value is not greater than threshold are not edges
+        """
+        if scipy.sparse.issparse(matrix):
+            matrix = matrix.tocoo()
+            keep = (matrix.data > threshold) & (matrix.row != matrix.col)
+            rows, cols, weights = matrix.row[keep], matrix.col[keep], matrix.data[keep]
+        else:
+            matrix = np.asarray(matrix)
+            mask = matrix > threshold
+            np.fill_diagonal(mask, False)
+            rows, cols = np.nonzero(mask)
+            weights = matrix[rows, cols]
+
+        nodes = np.asarray(list(nodes), dtype=object)
+        self.add_multiple_edges(zip(nodes[rows], nodes[cols], weights.tolist()))
 
     def add_multiple_edges(self, connections):
         """ Add edges (list of tuple pairs) to graph
@@ -92,6 +345,25 @@ class Graph(object):
                 parents.append(i)
         return parents
 
+    def get_children(self, node):
+        """ Get the list of children of a node
+
+        :param node: Selected node
+        :return: list of children of the nodes
+        :rtype: list
+        """
+        return list(self._graph.get(node, ()))
+
+    def get_weight(self, node1, node2):
+        """ Get the weight of the edge from node1 to node2
+
+        :param node1: cause of the edge
+        :param node2: effect of the edge
+        :return: weight of the edge, None if the edge does not exist
+        :rtype: float
+        """
+        return self._graph.get(node1, {}).get(node2)
+
     def get_list_nodes(self):
         """ Get list of all nodes in graph
 
@@ -100,14 +372,13 @@ class Graph(object):
 
         """
 
-        nodes = []
+        # Ordered set of the nodes
+        nodes = {}
         for i in self._graph:
-            if i not in nodes:
-                nodes.append(i)
-            for j in list(self._graph[i]):
-                if j not in nodes:
-                    nodes.append(j)
-        return nodes
+            nodes[i] = None
+            for j in self._graph[i]:
+                nodes[j] = None
+        return list(nodes)
 
     def get_list_edges(self, order_by_weight=True, descending=False, return_weights=True):
         """ Get list of edges according to order defined by parameters
@@ -125,35 +396,31 @@ class Graph(object):
                 list_edges.append([i, j])
                 weights.append(self._graph[i][j])
 
-        if order_by_weight and descending:
-            weights, list_edges = (list(i) for i
-                                   in zip(*sorted(zip(weights, list_edges),
-                                                  reverse=True)))
-        elif order_by_weight:
-            weights, list_edges = (list(i) for i
-                                   in zip(*sorted(zip(weights, list_edges))))
-        if return_weights:
-            return [[edge[0], edge[1], weight] for edge, weight in zip(list_edges, weights)]
-        else:
-            return list_edges
+        return order_edges(list_edges, weights, order_by_weight, descending, return_weights)
 
-    def get_adjacency_matrix(self):
+    def get_adjacency_matrix(self, sparse=False):
         """Get the adjacency matrix of the graph
 
+        :param sparse: return a scipy.sparse.csr_matrix instead of a dense matrix
         :return: Adjacency Matrix (size : Nodes x Nodes), List of nodes
         :rtype: (numpy.ndarray, list)
         """
 
         nodes = self.get_list_nodes()
-        edges = self.get_list_edges(order_by_weight=False)
-
-        m = np.zeros((len(nodes), len(nodes)))
-
-        for idx, e in enumerate(edges):
-            cause = nodes.index(e[0])
-            effect = nodes.index(e[1])
-
-            m[cause, effect] = e[2]
+        index = {node: idx for idx, node in enumerate(nodes)}
+        rows, cols, weights = [], [], []
+        for i in self._graph:
+            for j, weight in self._graph[i].items():
+                rows.append(index[i])
+                cols.append(index[j])
+                weights.append(weight)
+
+        if sparse:
+            m = scipy.sparse.csr_matrix((np.array(weights, dtype=float), (rows, cols)),
+                                        shape=(len(nodes), len(nodes)))
+        else:
+            m = np.zeros((len(nodes), len(nodes)))
+            m[np.array(rows, dtype=int), np.array(cols, dtype=int)] = weights
 
         return m, nodes
 
@@ -181,15 +448,32 @@ class Graph(object):
 
         """
 
-        for n, cxns in self._graph.iteritems():
-            try:
-                cxns.remove(node)
-            except KeyError:
-                pass
-        try:
-            del self._graph[node]
-        except KeyError:
-            pass
+        for parent in self.get_parents(node):
+            self.remove_edge(parent, node)
+        for child in self.get_children(node):
+            self.remove_edge(node, child)
+        self._graph.pop(node, None)
+
+    def fingerprint(self, index=None):
+        """ Fingerprint of the edges of the graph, the weights being ignored : equal graphs have
+        equal fingerprints, and distinct graphs distinct ones but with a negligible probability.
+        Fingerprints computed with the same index (by default, within a process) are comparable,
+        including with the fingerprints of GraphDelta (see utils.Fingerprint)
+
+        :param index: NodeIndex of the node names (utils.Fingerprint.default_index if None)
+        :rtype: int
+        """
+        index = index if index is not None else default_index
+        src, dst = [], []
+        for i in self._graph:
+            id_i = index.id(i)
+            for j in self._graph[i]:
+                id_j = index.id(j)
+                # Each undirected edge is in both adjacencies : only one copy is included
+                if self._directed or id_i <= id_j:
+                    src.append(id_i)
+                    dst.append(id_j)
+        return xor_fingerprint(src, dst, self._directed)
 
     def __str__(self):
         return '{}({})'.format(self.__class__.__name__, dict(self._graph))
@@ -201,8 +485,55 @@ class DirectedGraph(Graph):
     def __init__(self, df=None, adjacency_matrix=False, skeleton = False):
         self.skeleton = skeleton
         """ Create a new directed graph structure"""
+        # Topological order maintained incrementally : position of each node
+        # and node at each position. Only meaningful if self._order_valid
+        self._order_index = {}
+        self._order_nodes = []
+        self._order_valid = True
+        # Reverse adjacency : parents of each node, as ordered sets (dicts of None)
+        self._parents = defaultdict(dict)
+        # List of nodes, topological order and fingerprint of the current structure, None once modified
+        self._nodes_cache = None
+        self._topological_cache = None
+        self._fingerprint_cache = None
         super(DirectedGraph, self).__init__(df, adjacency_matrix)
 
+    def _structure_changed(self):
+        """ Invalidate the cached list of nodes, topological order and fingerprint """
+        self._nodes_cache = None
+        self._topological_cache = None
+        self._fingerprint_cache = None
+
+    def fingerprint(self, index=None):
+        """ Fingerprint of the edges of the graph (see Graph.fingerprint), cached until the structure changes
+
+        :param index: NodeIndex of the node names (utils.Fingerprint.default_index if None)
+        :rtype: int
+        """
+        index = index if index is not None else default_index
+        if self._fingerprint_cache is None or self._fingerprint_cache[0] is not index:
+            self._fingerprint_cache = (index, super(DirectedGraph, self).fingerprint(index))
+        return self._fingerprint_cache[1]
+
+    def __getstate__(self):
+        # The ids of the index are only valid in this process
+        state = self.__dict__.copy()
+        state['_fingerprint_cache'] = None
+        return state
+
+    def add_multiple_edges(self, connections):
+        """ Add edges (list of tuple pairs) to graph ; the topological order is computed once for all the edges
+
+        :param connections: List of tuples (cause, effect, weight)
+        :type connections: list
+        """
+
+        for node1, node2, *weight in connections:
+            self._graph[node1][node2] = weight[0] if weight else 1
+            self._parents[node2][node1] = None
+        self._structure_changed()
+        self._rebuild_order()
+
     def add(self, node1, node2, weight=1):
         """ Add or update directed edge from node1 to node2
 
@@ -212,59 +543,164 @@ class DirectedGraph(Graph):
         :type weight: float
         """
 
+        new_edge = node2 not in self._graph.get(node1, ())
         self._graph[node1][node2] = weight
+        if new_edge:
+            self._parents[node2][node1] = None
+            self._structure_changed()
+            self._update_order(node1, node2)
         return self
 
+    def get_parents(self, node):
+        """ Get the list of parents of a node, from the reverse adjacency
+
+        :param node: Selected node
+        :return: list of parents of the nodes
+        :rtype: list
+        """
+        return list(self._parents.get(node, ()))
+
+    def get_list_nodes(self):
+        """ Get list of all nodes in graph, cached until the structure changes
+
+        :return: List of nodes
+        :rtype: list
+        """
+        if self._nodes_cache is None:
+            self._nodes_cache = super(DirectedGraph, self).get_list_nodes()
+        return list(self._nodes_cache)
+
+    def topological_order(self, nodes=None):
+        """ Nodes of the graph, causes before effects ; cached until the structure changes
+
+        :param nodes: other nodes to include, placed first if they have no edges
+        :return: list of nodes
+        :rtype: list
+        """
+        if self._topological_cache is None:
+            if not self._order_valid and not self._rebuild_order():
+                raise ValueError('The graph is cyclic : no topological order')
+            in_graph = set(self.get_list_nodes())
+            # The incremental order may keep nodes whose edges were all removed
+            self._topological_cache = [node for node in self._order_nodes if node in in_graph]
+        return add_isolated_nodes(list(self._topological_cache), nodes)
+
+    def _update_order(self, node1, node2):
+        """ Update the topological order after the insertion of node1 -> node2
+
+        Only the nodes placed between node2 and node1 in the current order are
+        visited and reordered (Marchetti-Spaccamela et al. dynamic topological sort).
+        If the new edge closes a cycle, the order is invalidated.
+
+        :param node1: cause of the new edge
+        :param node2: effect of the new edge
+        """
+        for node in (node1, node2):
+            if node not in self._order_index:
+                self._order_index[node] = len(self._order_nodes)
+                self._order_nodes.append(node)
+
+        if not self._order_valid:
+            return
+        lower = self._order_index[node2]
+        upper = self._order_index[node1]
+        if lower > upper:
+            return
+
+        reached = self._forward_region(node2, upper)
+        if node1 in reached:
+            self._order_valid = False
+            return
+
+        region = self._order_nodes[lower:upper + 1]
+        region = ([n for n in region if n not in reached]
+                  + [n for n in region if n in reached])
+        for position, node in enumerate(region, lower):
+            self._order_nodes[position] = node
+            self._order_index[node] = position
+
+    def _forward_region(self, start, upper, ignored_edge=None):
+        """ Nodes reachable from start through nodes placed before upper in the topological order
+
+        :param start: node to start the search from
+        :param upper: maximal position in the topological order of the visited nodes
+        :param ignored_edge: edge (cause, effect) not followed during the search
+        :return: set of reached nodes
+        :rtype: set
+        """
+        reached = {start}
+        fringe = [start]
+        while fringe:
+            node = fringe.pop()
+            for child in self._graph.get(node, ()):
+                if ((node, child) != ignored_edge and child not in reached
+                        and self._order_index[child] <= upper):
+                    reached.add(child)
+                    fringe.append(child)
+        return reached
+
+    def _rebuild_order(self):
+        """ Recompute the whole topological order (Kahn's algorithm)
+
+        :return: True if the graph is acyclic and the order is valid
+        :rtype: bool
+        """
+        order = dict_topological_order(self.get_dict_nw())
+
+        self._order_valid = order is not None
+        if self._order_valid:
+            self._order_nodes = order
+            self._order_index = {node: idx for idx, node in enumerate(order)}
+        return self._order_valid
+
+    def would_create_cycle(self, node1, node2):
+        """ Check if adding the edge node1 -> node2 would create a cycle
+
+        An existing edge node2 -> node1 is not followed, so that
+        ``would_create_cycle(node2, node1)`` tells whether reversing node1 -> node2
+        is possible. Only the region of the topological order between
+        node2 and node1 is explored.
+
+        :param node1: cause of the new edge
+        :param node2: effect of the new edge
+        :return: True if the resulting graph would be cyclic
+        :rtype: bool
+        """
+        if node1 == node2:
+            return True
+        if not self._order_valid and not self._rebuild_order():
+            # Graph already cyclic : full check on the modified structure
+            g = self.get_dict_nw()
+            g[node2] = [i for i in g.get(node2, []) if i != node1]
+            g.setdefault(node1, []).append(node2)
+            return dict_is_cyclic(g)
+
+        if node1 not in self._order_index or node2 not in self._order_index:
+            return False
+        upper = self._order_index[node1]
+        if self._order_index[node2] > upper:
+            return False
+        return node1 in self._forward_region(node2, upper, (node2, node1))
+
     def is_cyclic(self):
         """
         Return True if the directed graph g has a cycle.
-        g must be represented as a dictionary mapping vertices to
-        iterables of neighbouring vertices.
+        Uses the incrementally maintained topological order when available.
 
         :return: True if the directed graph is cyclic
         :rtype: bool
         """
-        path = set()
-        visited = set()
-
-        def visit(vertex):
-            if vertex in visited:
-                return False
-            visited.add(vertex)
-            path.add(vertex)
-            for neighbour in g.get(vertex, ()):
-                if neighbour in path or visit(neighbour):
-                    return True
-            path.remove(vertex)
+        if self._order_valid:
             return False
-
-        g = self.get_dict_nw()
-        return any(visit(v) for v in g)
+        return not self._rebuild_order()
 
     def cycles(self):
-        """Return the list of cycles of the directed graph g .
-        g must be represented as a dictionary mapping vertices to
-        iterables of neighbouring vertices. For example:
+        """Return the list of cycles of the directed graph
 
         :return: Cycles in the graph
         :rtype: list
         """
-
-        def dfs(graph, start, end):
-            fringe = [(start, [])]
-            # print(len(graph))
-            while fringe:
-                state, path = fringe.pop()
-                if path and state == end:
-                    yield path
-                    continue
-                for next_state in graph[state]:
-                    if next_state in path:
-                        continue
-                    fringe.append((next_state, path + [next_state]))
-
-        g = self.get_dict_nw()
-        return [[node] + path for node in g for path in dfs(g, node, node) if path]
+        return dict_cycles(self.get_dict_nw())
 
     def reverse_edge(self, node1, node2, weight=None):
         """ Reverse the edge between node1 and node2
@@ -290,36 +726,38 @@ class DirectedGraph(Graph):
         del self._graph[node1][node2]
         if len(self._graph[node1]) == 0:
             del self._graph[node1]
+        del self._parents[node2][node1]
+        if len(self._parents[node2]) == 0:
+            del self._parents[node2]
+        self._structure_changed()
 
     def remove_cycles(self, verbose=True):
         """ Remove all cycles in graph by using the weights
 
-        The edges with the lowest weight values will be reversed or deleted.
-        """
-
-        list_ordered_edges = self.get_list_edges(return_weights=False)
-        while self.is_cyclic():
-            cc = self.cycles()
-            # Select the first link:
-            s_cycle = cc[0]
-            r_edge = next(edge for edge in list_ordered_edges if
-                          any(edge == s_cycle[i:i + 2]
-                              for i in range(len(s_cycle) - 1)))
-            print('CC:' + str(cc))
-            print(r_edge)
-            # Look if the edge can't be reversed
-            test_graph = deepcopy(self)
-            test_graph.reverse_edge(r_edge[0], r_edge[1])
-            print(test_graph)
-            if len(self.cycles()) < len(cc):
-                self.reverse_edge(r_edge[0], r_edge[1])
-                if verbose:
-                    print('Link {} got reversed !'.format(r_edge))
-
-            else:  # remove the edge
-                self.remove_edge(r_edge[0], r_edge[1])
-                if verbose:
-                    print('Link {} got deleted !'.format(r_edge))
+        In each strongly connected component, the vertices are ordered by the weighted greedy
+        feedback arc set heuristic (see greedy_feedback_order) ; the edges going backwards in this
+        order, of low weights, are reversed, or deleted if the reverse edge already exists.
+        Every edge then follows the order, so that the graph is acyclic. Runs in O(E log V)
+        """
+
+        for component in dict_strongly_connected_components(self.get_dict_nw()):
+            if len(component) < 2:
+                continue
+            position = {node: idx for idx, node in enumerate(greedy_feedback_order(component, self._graph))}
+            backward = [[i, j] for i in component for j in self._graph.get(i, ())
+                        if j in position and position[j] < position[i]]
+            logger.debug('Component:%s, edges against the order:%s', component, backward)
+
+            for r_edge in backward:
+                if self.get_weight(r_edge[1], r_edge[0]) is None:
+                    self.reverse_edge(r_edge[0], r_edge[1])
+                    if verbose:
+                        logger.info('Link %s got reversed !', r_edge)
+
+                else:  # the reversed edge exists : remove the edge
+                    self.remove_edge(r_edge[0], r_edge[1])
+                    if verbose:
+                        logger.info('Link %s got deleted !', r_edge)
 
     def remove_cycle_without_deletion(self):
         """
@@ -331,7 +769,7 @@ class DirectedGraph(Graph):
         :rtype: bool
         """
         g = self.get_dict_nw()
-        print(g)
+        logger.debug('Graph:%s', g)
         path = set()
         visited = set()
 
@@ -357,31 +795,29 @@ class DirectedGraph(Graph):
         :param node2: effect of the edge
         :param weight: new weight of the edge
         """
-        self._graph[node1][node2] = weight
+        self.add(node1, node2, weight)
 
     def get_correlation_matrix(self, sigma):
         nodes = self.skeleton.get_list_nodes()
-        edges = self.skeleton.get_list_edges_without_duplicate()
-        m = np.zeros((len(nodes), len(nodes)))
-
-        for idx in range(len(nodes)):
-            m[idx, idx] = 1
-
-        for idx, e in enumerate(edges):
-            cause = nodes.index(e[0])
-            effect = nodes.index(e[1])
+        index = {node: idx for idx, node in enumerate(nodes)}
+        m = np.eye(len(nodes))
 
-            m[cause, effect] = sigma
-            m[effect, cause] = sigma
+        # Both directions of the undirected edges are stored
+        for i in self.skeleton._graph:
+            for j in self.skeleton._graph[i]:
+                m[index[i], index[j]] = sigma
 
         return m
 
 
 class UndirectedGraph(Graph):
     """ Graph data structure, undirected. """
+    _directed = False
 
     def __init__(self, df=None, adjacency_matrix=False):
         """ Create a new undirected graph structure"""
+        # Edges without duplicate, None once the structure is modified
+        self._edges_cache = None
         super(UndirectedGraph, self).__init__(df, adjacency_matrix)
 
     def add(self, node1, node2, weight=1):
@@ -393,6 +829,8 @@ class UndirectedGraph(Graph):
         :type weight: float
         """
 
+        if node2 not in self._graph.get(node1, ()):
+            self._edges_cache = None
         self._graph[node1][node2] = weight
         self._graph[node2][node1] = weight
 
@@ -404,12 +842,23 @@ class UndirectedGraph(Graph):
         """
         del self._graph[node1][node2]
         del self._graph[node2][node1]
+        self._edges_cache = None
         if len(self._graph[node1]) == 0:
             del self._graph[node1]
 
         if len(self._graph[node2]) == 0:
             del self._graph[node2]
 
+    def get_parents(self, node):
+        """ Get the list of parents of a node : both directions of the edges are stored,
+        so that the parents are the neighbors
+
+        :param node: Selected node
+        :return: list of parents of the nodes
+        :rtype: list
+        """
+        return list(self._graph.get(node, ()))
+
     def get_neighbors(self, node):
         """ Get the list of neighbors of a node
 
@@ -417,20 +866,282 @@ class UndirectedGraph(Graph):
         :return: list of neighbors of the nodes
         :rtype: list
         """
-        return self.get_parents(node)
+        return list(self._graph.get(node, ()))
 
     def get_list_edges_without_duplicate(self):
-        """ Get list of edges according to order defined by parameters
+        """ Get list of edges, each edge [i, j] listed once in the direction in which it is
+        met first ; cached until the structure changes
         :return: List of edges
         :rtype: (list,list)"""
 
+        if self._edges_cache is None:
+            listed = set()
+            self._edges_cache = []
+            for i in self._graph:
+                for j in self._graph[i]:
+                    if (j, i) not in listed:
+                        listed.add((i, j))
+                        self._edges_cache.append((i, j))
+
+        return [[i, j] for i, j in self._edges_cache]
+
+
+
+
+_shared_graphs = {}
+_max_shared_graphs = 4
+
+
+def share_graph(graph):
+    """ Write a graph once to a temporary file, so that worker processes load it
+    a single time and afterwards only receive moves against it (see GraphDelta)
+
+    :param graph: graph to share
+    :return: key of the shared graph
+    :rtype: str
+    """
+    fd, key = tempfile.mkstemp(prefix='cgnn_graph_', suffix='.pkl')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(graph, f, protocol=pickle.HIGHEST_PROTOCOL)
+    # The process sharing the graph uses the object itself
+    _shared_graphs[key] = graph
+    return key
+
+
+def get_shared_graph(key):
+    """ Get a shared graph, loaded from disk at the first call in each process
+
+    :param key: key of the shared graph
+    :return: shared graph
+    """
+    if key not in _shared_graphs:
+        with open(key, 'rb') as f:
+            add_shared_graph(key, pickle.load(f))
+    return _shared_graphs[key]
+
+
+def add_shared_graph(key, graph):
+    """ Register in this process a shared graph received by other means than its file
+
+    :param key: key of the shared graph
+    :param graph: shared graph
+    """
+    while len(_shared_graphs) >= _max_shared_graphs:
+        del _shared_graphs[next(iter(_shared_graphs))]
+    _shared_graphs[key] = graph
+
+
+def has_shared_graph(key):
+    """ Check if a shared graph is already loaded in this process
+
+    :param key: key of the shared graph
+    :rtype: bool
+    """
+    return key in _shared_graphs
+
+
+def release_graph(key):
+    """ Delete a shared graph
+
+    :param key: key of the shared graph
+    """
+    _shared_graphs.pop(key, None)
+    try:
+        os.remove(key)
+    except OSError:
+        pass
+
+
+class GraphDelta(object):
+    """ Read-only directed graph defined by a few moves applied to a base graph.
+
+    The base graph is neither copied nor modified. Moves are tuples
+    ('reverse', node1, node2), ('remove', node1, node2) or ('add', node1, node2[, weight]).
+    If the base graph is shared (see share_graph), only its key and the moves are pickled.
+    """
+
+    def __init__(self, base, moves, key=None):
+        """ Create a new view of the base graph
+
+        :param base: base DirectedGraph
+        :param moves: list of moves applied to the base graph
+        :param key: key of the base graph if shared
+        """
+        self._base = base
+        self.key = key
+        self.moves = list(moves)
+        self._removed = set()
+        self._added = {}
+        for op, node1, node2, *weight in self.moves:
+            if op == 'reverse':
+                weight = self.get_weight(node1, node2)
+                if weight is None:
+                    raise ValueError('No edge {} -> {} to reverse'.format(node1, node2))
+                self._remove(node1, node2)
+                self._add(node2, node1, weight)
+            elif op == 'remove':
+                self._remove(node1, node2)
+            elif op == 'add':
+                self._add(node1, node2, weight[0] if weight else 1)
+            else:
+                raise ValueError('Unknown move {}'.format(op))
+
+    def _add(self, node1, node2, weight):
+        self._removed.add((node1, node2))
+        self._added[(node1, node2)] = weight
+
+    def _remove(self, node1, node2):
+        self._added.pop((node1, node2), None)
+        self._removed.add((node1, node2))
+
+    def get_weight(self, node1, node2):
+        """ Get the weight of the edge from node1 to node2
+
+        :param node1: cause of the edge
+        :param node2: effect of the edge
+        :return: weight of the edge, None if the edge does not exist
+        :rtype: float
+        """
+        if (node1, node2) in self._added:
+            return self._added[(node1, node2)]
+        if (node1, node2) in self._removed:
+            return None
+        return self.base.get_weight(node1, node2)
+
+    @property
+    def base(self):
+        if self._base is None:
+            self._base = get_shared_graph(self.key)
+        return self._base
+
+    @property
+    def skeleton(self):
+        return self.base.skeleton
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.key is not None:
+            state['_base'] = None
+        return state
+
+    def edges(self):
+        """ Iterate over the edges of the graph
+
+        :return: iterator of (cause, effect, weight)
+        """
+        base_graph = self.base._graph
+        for i in base_graph:
+            for j, weight in base_graph[i].items():
+                if (i, j) not in self._removed:
+                    yield i, j, weight
+        for (i, j), weight in self._added.items():
+            yield i, j, weight
+
+    def get_parents(self, node):
+        """ Get the list of parents of a node
+
+        :param node: Selected node
+        :return: list of parents of the nodes
+        :rtype: list
+        """
+        parents = [i for i in self.base.get_parents(node) if (i, node) not in self._removed]
+        parents.extend(i for (i, j) in self._added if j == node)
+        return parents
+
+    def get_children(self, node):
+        """ Get the list of children of a node
+
+        :param node: Selected node
+        :return: list of children of the nodes
+        :rtype: list
+        """
+        children = [j for j in self.base.get_children(node) if (node, j) not in self._removed]
+        children.extend(j for (i, j) in self._added if i == node)
+        return children
+
+    def get_list_nodes(self):
+        """ Get list of all nodes in graph
+
+        :return: List of nodes
+        :rtype: list
+        """
+        nodes = {}
+        for i, j, _ in self.edges():
+            nodes[i] = None
+            nodes[j] = None
+        return list(nodes)
+
+    def get_list_edges(self, order_by_weight=True, descending=False, return_weights=True):
+        """ Get list of edges according to order defined by parameters
+
+        :param order_by_weight: List of edges will be ordered by weight values
+        :param descending: order elements by decreasing weights
+        :param return_weights: return the list of weights
+        :return: List of edges and their weights
+        :rtype: list
+        """
         list_edges = []
+        weights = []
+        for i, j, weight in self.edges():
+            list_edges.append([i, j])
+            weights.append(weight)
+        return order_edges(list_edges, weights, order_by_weight, descending, return_weights)
 
-        for i in self._graph:
-            for j in list(self._graph[i]):
-                if([j, i] not in list_edges):
-                    list_edges.append([i, j])
+    def get_dict_nw(self):
+        """Get dictionary of graph without weight values
 
-        return list_edges
+        :return: Dictionary of the directed graph
+        :rtype: dict
+        """
+        dict_nw = defaultdict(list)
+        for i, j, _ in self.edges():
+            dict_nw[i].append(j)
+            if j not in dict_nw:
+                dict_nw[j] = []
+        return dict(dict_nw)
+
+    def is_cyclic(self):
+        """ Return True if the directed graph has a cycle
 
+        :return: True if the directed graph is cyclic
+        :rtype: bool
+        """
+        return dict_is_cyclic(self.get_dict_nw())
 
+    def topological_order(self, nodes=None):
+        """ Nodes of the graph, causes before effects
+
+        :param nodes: other nodes to include, placed first if they have no edges
+        :return: list of nodes
+        :rtype: list
+        """
+        order = dict_topological_order(self.get_dict_nw())
+        if order is None:
+            raise ValueError('The graph is cyclic : no topological order')
+        return add_isolated_nodes(order, nodes)
+
+    def fingerprint(self, index=None):
+        """ Fingerprint of the edges of the graph (see Graph.fingerprint), from the fingerprint of
+        the base graph and the keys of the edges changed by the moves only
+
+        :param index: NodeIndex of the node names (utils.Fingerprint.default_index if None)
+        :rtype: int
+        """
+        index = index if index is not None else default_index
+        fingerprint = self.base.fingerprint(index)
+        for node1, node2 in self._removed:
+            # Edges removed from the base graph, or added to it
+            if (self.base.get_weight(node1, node2) is not None) != ((node1, node2) in self._added):
+                fingerprint ^= edge_key(index, node1, node2)
+        return fingerprint
+
+    def cycles(self):
+        """Return the list of cycles of the directed graph
+
+        :return: Cycles in the graph
+        :rtype: list
+        """
+        return dict_cycles(self.get_dict_nw())
+
+    def __str__(self):
+        return '{}({}, {})'.format(self.__class__.__name__, self.base, self.moves)
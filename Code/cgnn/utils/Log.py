@@ -0,0 +1,160 @@
+"""
+Logging of the cgnn package
+Each module logs to its own logger (cgnn.GNN, cgnn.CGNN, ...). As for any library, the package
+only adds a NullHandler : records go to the handlers configured by the application, or are
+output by enable_logging and add_json_sink. The training loops check the level of their
+logger before formatting anything. The worker processes receive the handlers of
+enable_logging and add_json_sink through the log_config keyword argument of the runs
+(see logging_config and configure_worker).
+"""
+
+import json
+import logging
+import os
+import sys
+
+package_logger = logging.getLogger('cgnn')
+package_logger.addHandler(logging.NullHandler())
+
+# Handlers added by enable_logging and add_json_sink, with their description for the workers
+_handlers = []
+
+
+def get_logger(name):
+    """ Logger of a module of the package
+
+    :param name: name of the module (__name__)
+    :return: logger, child of the 'cgnn' logger
+    :rtype: logging.Logger
+    """
+    if name != 'cgnn' and not name.startswith('cgnn.'):
+        name = 'cgnn.' + name.split('.')[-1]
+    return logging.getLogger(name)
+
+
+class JSONLinesHandler(logging.Handler):
+    """ Write the records as JSON lines. Records below INFO (progress of the trainings) are
+    rate-limited : at most one record per message and per logger every min_interval seconds
+    """
+
+    def __init__(self, filename, min_interval=1.):
+        """ Open the sink
+
+        :param filename: path of the JSON-lines file, opened in append mode
+        :param min_interval: minimal delay in seconds between two progress records of the same message
+        """
+        super(JSONLinesHandler, self).__init__()
+        self.min_interval = min_interval
+        self._file = open(filename, 'a')
+        self._last = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.INFO:
+            return super(JSONLinesHandler, self).filter(record)
+        key = (record.name, record.msg)
+        if record.created - self._last.get(key, 0.) < self.min_interval:
+            return False
+        self._last[key] = record.created
+        return super(JSONLinesHandler, self).filter(record)
+
+    def emit(self, record):
+        try:
+            event = {'time': record.created,
+                     'level': record.levelname,
+                     'logger': record.name,
+                     'event': str(record.msg),
+                     'message': record.getMessage(),
+                     'args': record.args if isinstance(record.args, tuple) else [record.args]}
+            self._file.write(json.dumps(event, default=_to_json) + '\n')
+            self._file.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self._file.close()
+        super(JSONLinesHandler, self).close()
+
+
+def _to_json(obj):
+    """ Conversion of the numpy values and other objects in the records """
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    return str(obj)
+
+
+def enable_logging(level=logging.INFO, stream=sys.stdout):
+    """ Output the logs of the package on a stream
+
+    :param level: minimal level of the output records (logging.DEBUG for the training iterations)
+    :param stream: output stream
+    :return: the handler
+    :rtype: logging.Handler
+    """
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    handler.setLevel(level)
+    _add_handler(handler, ('stream', level))
+    return handler
+
+
+def add_json_sink(filename, level=logging.DEBUG, min_interval=1.):
+    """ Write the logs of the package to a JSON-lines file
+
+    :param filename: path of the file
+    :param level: minimal level of the written records
+    :param min_interval: minimal delay in seconds between two progress records of the same message
+    :return: the handler
+    :rtype: JSONLinesHandler
+    """
+    handler = JSONLinesHandler(filename, min_interval)
+    handler.setLevel(level)
+    _add_handler(handler, ('json', os.path.abspath(filename), level, min_interval))
+    return handler
+
+
+def remove_handler(handler):
+    """ Stop and remove a handler added by enable_logging or add_json_sink """
+    package_logger.removeHandler(handler)
+    handler.close()
+    _handlers[:] = [(h, spec) for h, spec in _handlers if h is not handler]
+    _update_level()
+
+
+def _add_handler(handler, spec):
+    package_logger.addHandler(handler)
+    _handlers.append((handler, spec))
+    _update_level()
+
+
+def _update_level():
+    """ Set the level of the package to the lowest level of the handlers of enable_logging and
+    add_json_sink, so that their records are created ; without them, the level is left to the application """
+    package_logger.setLevel(min(h.level for h, _ in _handlers) if _handlers else logging.NOTSET)
+
+
+def logging_config():
+    """ Description of the handlers added by enable_logging and add_json_sink, passed to the runs
+    as the log_config keyword argument
+
+    :return: picklable configuration, None if there are no handlers
+    """
+    if not _handlers:
+        return None
+    return {'handlers': [spec for _, spec in _handlers]}
+
+
+def configure_worker(config):
+    """ Add the handlers of the parent process in a worker process, unless already there
+    (same process, forked process, or worker already configured)
+
+    :param config: configuration returned by logging_config in the parent process, or None
+    """
+    if config is None:
+        return
+    for spec in config['handlers']:
+        if tuple(spec) in set(tuple(s) for _, s in _handlers):
+            continue
+        if spec[0] == 'stream':
+            enable_logging(spec[1])
+        else:
+            add_json_sink(*spec[1:])
@@ -32,6 +32,41 @@ def MMD_loss_tf(xy_true, xy_pred):
     return loss
 
 
+def MMD_loss_batch_tf(xy_true, xy_pred, mask=None):
+    """ MMD loss computed independently for each element of a batch
+
+    :param xy_true: real data, tensor of shape (B, N, d)
+    :param xy_pred: generated data, tensor of shape (B, N, d)
+    :param mask: None, or tensor of shape (B, N) : 1 for the points of each element, 0 for padding
+    :return: tensor of shape (B,), MMD loss of each element
+    """
+    _, N, _ = xy_pred.get_shape().as_list()
+
+    X = tf.concat([xy_pred, xy_true], 1)
+    XX = tf.matmul(X, X, transpose_b=True)
+    X2 = tf.reduce_sum(X * X, 2, keep_dims=True)
+    exponent = -2*XX + X2 + tf.transpose(X2, [0, 2, 1])
+
+    if mask is None:
+        s1 = tf.constant(1.0 / N, shape=[N, 1])
+        s2 = -tf.constant(1.0 / N, shape=[N, 1])
+        s = tf.concat([s1, s2], 0)
+        S = tf.matmul(s, tf.transpose(s))
+    else:
+        # Padded points get a null weight, real points 1/n (generated) and -1/n (real)
+        w = mask / tf.reduce_sum(mask, 1, keep_dims=True)
+        s = tf.expand_dims(tf.concat([w, -w], 1), 2)
+        S = tf.matmul(s, s, transpose_b=True)
+
+    loss = 0
+
+    for i in range(len(bandwiths_gamma)):
+        kernel_val = tf.exp(-bandwiths_gamma[i] * exponent)
+        loss += tf.reduce_sum(S * kernel_val, [1, 2])
+
+    return loss
+
+
 def rp(k,s,d):
 
   return tf.transpose(tf.concat([tf.concat([2*si*tf.random_normal([k,d], mean=0, stddev=1) for si in s], axis = 0), tf.random_uniform([k*len(s),1], minval=0, maxval=2*np.pi)], axis = 1))
@@ -58,6 +93,37 @@ def Fourier_MMD_Loss_tf(xy_true, xy_pred,nb_vectors_approx_MMD):
 
 
 
+def Fourier_MMD_Loss_batch_tf(xy_true, xy_pred, nb_vectors_approx_MMD, mask=None):
+    """ Fourier approximation of the MMD loss computed independently for each element of a batch
+
+    :param xy_true: real data, tensor of shape (B, N, d)
+    :param xy_pred: generated data, tensor of shape (B, N, d)
+    :param nb_vectors_approx_MMD: number of random vectors per bandwidth
+    :param mask: None, or tensor of shape (B, N) : 1 for the points of each element, 0 for padding
+    :return: tensor of shape (B,), approximated MMD loss of each element
+    """
+    B, N, nDim = xy_pred.get_shape().as_list()
+
+    w = tf.concat([2*si*tf.random_normal([B, nDim, nb_vectors_approx_MMD], mean=0, stddev=1)
+                   for si in bandwiths_gamma], axis=2)
+    bias = tf.random_uniform([B, 1, nb_vectors_approx_MMD*len(bandwiths_gamma)], minval=0, maxval=2*np.pi)
+    wz = tf.concat([w, bias], axis=1)
+
+    ones = tf.ones((B, N, 1))
+    f_true = tf.cos(tf.matmul(tf.concat([xy_true, ones], 2), wz))
+    f_pred = tf.cos(tf.matmul(tf.concat([xy_pred, ones], 2), wz))
+
+    if mask is None:
+        e1 = tf.sqrt(2/nb_vectors_approx_MMD)*tf.reduce_mean(f_true, axis=1)
+        e2 = tf.sqrt(2/nb_vectors_approx_MMD)*tf.reduce_mean(f_pred, axis=1)
+    else:
+        w = tf.expand_dims(mask / tf.reduce_sum(mask, 1, keep_dims=True), 2)
+        e1 = tf.sqrt(2/nb_vectors_approx_MMD)*tf.reduce_sum(f_true * w, axis=1)
+        e2 = tf.sqrt(2/nb_vectors_approx_MMD)*tf.reduce_sum(f_pred * w, axis=1)
+
+    return tf.reduce_sum((e1 - e2) ** 2, axis=1)
+
+
 def MomentMatchingLoss_tf(xy_true, xy_pred, nb_moment = 1):
     """ k-moments loss, k being a parameter. These moments are raw moments and not normalized
 
@@ -0,0 +1,246 @@
+"""
+Profiling of the model runs : timings of the phases of each run, aggregated per candidate and per search
+"""
+
+import os
+import resource
+import socket
+import time
+
+from .Log import get_logger
+
+logger = get_logger(__name__)
+
+phases = ('data', 'build', 'session', 'train', 'evaluate')
+
+
+class RunProfile(object):
+    """ Record of a run, filled by the run functions and the train/evaluate methods of the models.
+
+    Memory is measured on the peak resident set size of the worker process (kilobytes on Linux) :
+    process_peak_rss is the peak of the process since its start, including the previous runs of a
+    reused worker, and peak_rss_increase the increase of this peak during the run (0 if the run stayed
+    below the peak of a previous run)
+    """
+
+    def __init__(self, idx, run, trace_file=None, direction=None):
+        """ Start the record of a run
+
+        :param idx: number of the candidate (graph or pair)
+        :param run: number of the run
+        :param trace_file: if not None, a TF trace of the last train step is written to this file
+        :param direction: direction of a pairwise run (0 : a -> b, 1 : b -> a), None for a graph
+        """
+        self.trace_file = trace_file
+        self.record = {'idx': idx, 'run': run, 'direction': direction,
+                       'worker': '{}:{}'.format(socket.gethostname(), os.getpid()),
+                       'phases': dict.fromkeys(phases, 0.),
+                       'epochs': {}, 'final_loss': None, 'process_peak_rss': None, 'peak_rss_increase': None}
+        self._start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self._start = self._last = time.time()
+
+    def mark(self, name):
+        """ End a phase : the time since the end of the previous phase is added to the phase name """
+        now = time.time()
+        self.record['phases'][name] = self.record['phases'].get(name, 0.) + now - self._last
+        self._last = now
+
+    def set_epochs(self, name, epochs, loss):
+        """ Number of epochs of a phase and loss at its end """
+        self.record['epochs'][name] = epochs
+        self.record['final_loss'] = float(loss)
+
+    def finish(self):
+        """ Close the record
+
+        :return: the record
+        :rtype: dict
+        """
+        self.record['total'] = time.time() - self._start
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.record['process_peak_rss'] = peak_rss
+        self.record['peak_rss_increase'] = peak_rss - self._start_rss
+        return self.record
+
+
+def mark(profile, name):
+    """ End a phase of a run if the run is profiled (profile not None) """
+    if profile is not None:
+        profile.mark(name)
+
+
+class ProfiledScore(float):
+    """ Score of a run carrying the record of the run (attribute profile) """
+
+    def __new__(cls, value, profile):
+        score = super(ProfiledScore, cls).__new__(cls, value)
+        score.profile = profile
+        return score
+
+    def __reduce__(self):
+        return ProfiledScore, (float(self), self.profile)
+
+
+def run_profile(idx, run, direction=None, **kwargs):
+    """ RunProfile of a run if the runs are profiled
+
+    :param idx: number of the candidate (graph or pair)
+    :param run: number of the run
+    :param direction: direction of a pairwise run (0 : a -> b, 1 : b -> a), None for a graph
+    :param kwargs: profile_runs=(False) profile the runs
+    :param kwargs: trace_run=(None) (idx, run, file) : the TF trace of this run is written to file ;
+     the trace of each direction of a pairwise run goes to its own file, suffixed by _XY or _YX
+    :return: RunProfile or None
+    """
+    if not kwargs.get('profile_runs', False):
+        return None
+    trace_run = kwargs.get('trace_run')
+    trace_file = None
+    if trace_run is not None and tuple(trace_run[:2]) == (idx, run):
+        trace_file = trace_run[2]
+        if direction is not None:
+            root, ext = os.path.splitext(trace_file)
+            trace_file = '{}_{}{}'.format(root, ('XY', 'YX')[direction], ext)
+    return RunProfile(idx, run, trace_file, direction)
+
+
+def profiled(score, profile):
+    """ Attach the record of the run to its score
+
+    :param score: score of the run
+    :param profile: RunProfile or None
+    :return: ProfiledScore, or score if the run is not profiled
+    """
+    if profile is None:
+        return score
+    return ProfiledScore(score, profile.finish())
+
+
+def trace_step(profile, epochs):
+    """ Train step to trace
+
+    :param profile: RunProfile or None
+    :param epochs: number of train epochs
+    :return: number of the last step if the run is traced, else -1
+    """
+    if profile is None or profile.trace_file is None:
+        return -1
+    return epochs - 1
+
+
+def trace_options():
+    """ Arguments of session.run to trace a step
+
+    :return: dict of keyword arguments of session.run
+    """
+    import tensorflow as tf
+    return {'options': tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
+            'run_metadata': tf.RunMetadata()}
+
+
+def write_trace(profile, run_kwargs):
+    """ Write the trace of a step run with the arguments of trace_options, in the chrome trace format """
+    if 'run_metadata' not in run_kwargs:
+        return
+    from tensorflow.python.client import timeline
+    with open(profile.trace_file, 'w') as f:
+        f.write(timeline.Timeline(run_kwargs['run_metadata'].step_stats).generate_chrome_trace_format())
+
+
+class Profiler(object):
+    """ Collect the records of the runs and aggregate them per candidate and per search.
+    Subclasses may override on_run, on_candidate and on_search to get the records as they come
+    """
+
+    def __init__(self):
+        self.runs = []
+        self.candidates = []
+        self.searches = []
+
+    def on_run(self, record):
+        """ Called for each profiled run """
+        self.runs.append(record)
+
+    def on_candidate(self, summary):
+        """ Called for each evaluated candidate (graph or pair) with the aggregate of its runs """
+        self.candidates.append(summary)
+        logger.debug('Profile of candidate %s : %s', summary['idx'], summary)
+
+    def on_search(self, summary):
+        """ Called at the end of a search with the aggregate of its candidates """
+        self.searches.append(summary)
+        logger.info('Profile of %s : %s', summary['search'], summary)
+
+    def add_candidate(self, idx, results, wall):
+        """ Records of the runs of a candidate
+
+        :param idx: number of the candidate
+        :param results: scores returned by the runs (ProfiledScore, possibly in lists or tuples)
+        :param wall: time of the evaluation of the candidate, including the dispatch to the workers
+        """
+        records = list(_find_records(results))
+        for record in records:
+            self.on_run(record)
+        summary = aggregate(records)
+        summary['idx'] = idx
+        summary['wall'] = wall
+        # Time not spent in the runs : pickling, dispatch and waiting for the slowest worker
+        summary['overhead'] = wall - max([r['total'] for r in records] or [0.])
+        self.on_candidate(summary)
+
+    def end_search(self, name):
+        """ Aggregate the candidates evaluated since the end of the previous search
+
+        :param name: name of the search
+        :return: summary of the search
+        :rtype: dict
+        """
+        start = sum(s['nb_candidates'] for s in self.searches)
+        candidates = self.candidates[start:]
+        summary = {'search': name, 'nb_candidates': len(candidates),
+                   'nb_runs': sum(c['nb_runs'] for c in candidates),
+                   'wall': sum(c['wall'] for c in candidates),
+                   'overhead': sum(c['overhead'] for c in candidates),
+                   'phases': {p: sum(c['phases'].get(p, 0.) for c in candidates) for p in phases},
+                   'process_peak_rss': _max(c['process_peak_rss'] for c in candidates),
+                   'peak_rss_increase': _max(c['peak_rss_increase'] for c in candidates)}
+        self.on_search(summary)
+        return summary
+
+
+def aggregate(records):
+    """ Aggregate the records of runs
+
+    :param records: list of records
+    :return: number of runs, total time of each phase, mean epochs, mean final loss, peak RSS
+     (see RunProfile) and workers
+    :rtype: dict
+    """
+    losses = [r['final_loss'] for r in records if r['final_loss'] is not None]
+    epochs = {}
+    for r in records:
+        for name, nb in r['epochs'].items():
+            epochs.setdefault(name, []).append(nb)
+    return {'nb_runs': len(records),
+            'phases': {p: sum(r['phases'].get(p, 0.) for r in records) for p in phases},
+            'epochs': {name: sum(nb) / len(nb) for name, nb in epochs.items()},
+            'final_loss': sum(losses) / len(losses) if losses else None,
+            'process_peak_rss': _max(r['process_peak_rss'] for r in records),
+            'peak_rss_increase': _max(r['peak_rss_increase'] for r in records),
+            'workers': sorted(set(r['worker'] for r in records))}
+
+
+def _find_records(results):
+    """ Records of the ProfiledScore in the results of runs """
+    if isinstance(results, ProfiledScore):
+        yield results.profile
+    elif isinstance(results, (list, tuple)):
+        for result in results:
+            for record in _find_records(result):
+                yield record
+
+
+def _max(values):
+    """ Maximum of the values that are not None, None if there are none """
+    values = [v for v in values if v is not None]
+    return max(values) if values else None
@@ -0,0 +1,157 @@
+"""
+Scheduling of the edges evaluated by the structure searches
+"""
+
+import heapq
+import random
+
+
+def weight_priority(edge):
+    """ Edges with the lowest weights first """
+    return edge[2]
+
+
+def random_priority(edge):
+    """ Random order """
+    return random.random()
+
+
+move_orderings = {'weight': weight_priority,
+                  'random': random_priority}
+
+
+def markov_blanket(graph, node):
+    """ Get the Markov blanket of a node : parents, children and parents of the children
+
+    :param graph: DirectedGraph
+    :param node: Selected node
+    :return: nodes of the Markov blanket
+    :rtype: set
+    """
+    children = graph.get_children(node)
+    blanket = set(graph.get_parents(node))
+    blanket.update(children)
+    for child in children:
+        blanket.update(graph.get_parents(child))
+    blanket.discard(node)
+    return blanket
+
+
+class EdgeScheduler(object):
+    """ Priority queue of the edges to (re)consider during a hill-climbing search
+
+    Edges are stored without orientation : the current orientation is read from the graph
+    when the edge is popped. Two modes are available :
+
+    - sweep : all edges are queued ; once the queue is empty, all the edges are queued
+      again if a move was accepted during the sweep.
+    - dirty : after an accepted move, only the edges between nodes of the Markov blankets
+      of the touched nodes are queued again ; the search ends when the queue is empty.
+
+    With first_improvement, an accepted move starts a new sweep from the edges of highest
+    priority instead of continuing the current one. With max_tries, a sweep ends after
+    max_tries evaluations (in dirty mode : max_tries evaluations without accepted move).
+    """
+
+    def __init__(self, graph, dirty_only=False, priority=weight_priority,
+                 first_improvement=False, max_tries=None):
+        """ Queue all the edges of the graph
+
+        :param graph: DirectedGraph being optimized
+        :param dirty_only: use the dirty mode instead of full sweeps
+        :param priority: function of an edge [cause, effect, weight] ; lowest values are popped first
+        :param first_improvement: start a new sweep after each accepted move
+        :param max_tries: maximal number of evaluations per sweep (None for no limit)
+        """
+        self.graph = graph
+        self.dirty_only = dirty_only
+        self.priority = priority
+        self.first_improvement = first_improvement
+        self.max_tries = max_tries
+        self.improved = False
+        self.nb_sweeps = 0
+        self.tries = 0
+        self._heap = []
+        self._queued = set()
+        self._counter = 0
+        self.push_all()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, node1, node2, weight):
+        """ Queue an edge if not already queued
+
+        :param node1: cause of the edge
+        :param node2: effect of the edge
+        :param weight: weight of the edge
+        """
+        key = frozenset((node1, node2))
+        if key in self._queued:
+            return
+        self._queued.add(key)
+        heapq.heappush(self._heap, (self.priority([node1, node2, weight]), self._counter, key))
+        self._counter += 1
+
+    def push_all(self):
+        """ Queue all the edges of the graph (new sweep) """
+        self.nb_sweeps += 1
+        self.tries = 0
+        self._heap = []
+        self._queued = set()
+        for node1, node2, weight in self.graph.get_list_edges(order_by_weight=False):
+            self.push(node1, node2, weight)
+
+    def mark_dirty(self, nodes):
+        """ Queue the edges between nodes of the Markov blankets of the given nodes
+
+        :param nodes: nodes touched by an accepted move
+        """
+        region = set(nodes)
+        for node in nodes:
+            region.update(markov_blanket(self.graph, node))
+        for node in region:
+            for child in self.graph.get_children(node):
+                if child in region:
+                    self.push(node, child, self.graph.get_weight(node, child))
+
+    def accept(self, nodes):
+        """ Signal an accepted move
+
+        :param nodes: nodes touched by the move
+        """
+        self.improved = True
+        if self.dirty_only:
+            self.tries = 0
+            self.mark_dirty(nodes)
+        elif self.first_improvement:
+            self.improved = False
+            self.push_all()
+
+    def tried(self):
+        """ Signal an evaluation of a candidate move """
+        self.tries += 1
+
+    def pop(self):
+        """ Get the next edge to consider, in its current orientation
+
+        :return: edge [cause, effect, weight], or None when the search is over
+        :rtype: list
+        """
+        while True:
+            if self.max_tries is not None and self.tries >= self.max_tries:
+                self._heap = []
+                self._queued = set()
+            while self._heap:
+                _, _, key = heapq.heappop(self._heap)
+                self._queued.discard(key)
+                node1, node2 = tuple(key)
+                for cause, effect in ((node1, node2), (node2, node1)):
+                    weight = self.graph.get_weight(cause, effect)
+                    if weight is not None:
+                        return [cause, effect, weight]
+
+            if self.dirty_only or not self.improved:
+                return None
+            self.improved = False
+            self.push_all()
@@ -20,7 +20,21 @@ class DefaultSettings(object):
                  "use_Fast_MMD",
                  "nb_vectors_approx_MMD",
                  "complexity_graph_param",
-		          "max_nb_points")
+		          "max_nb_points",
+                 "scheduling",
+                 "move_ordering",
+                 "first_improvement",
+                 "max_tries",
+                 "batched_pairwise",
+                 "batch_size",
+                 "scheduled_pairwise",
+                 "cascade",
+                 "cascade_stages",
+                 "adaptive_runs",
+                 "runs_per_wave",
+                 "min_runs",
+                 "stopping_confidence",
+                 "init_mechanisms")
 
     def __init__(self):  # Define here the default values of the parameters
         self.NB_RUNS = 32
@@ -32,6 +46,24 @@ class DefaultSettings(object):
         self.init_weights = 0.05
         self.max_nb_points = 1500
 
+        # Pairwise
+        self.cascade = False
+        self.cascade_stages = [('entropy', 0.5), ('residual', 0.5)]
+
+        # GNN
+        self.batched_pairwise = False
+        # Number of pairs per vectorized model (batched_pairwise, predict_matrix) : each pair brings
+        # 2 * NB_RUNS generators, and the MMD of a model takes batch_size * 2 * NB_RUNS * (2 * n)^2 floats.
+        # With batched_pairwise, pairs are sorted by length and a model pads its pairs to the longest
+        # one, masked in the MMD : with batch_size = 1 no padding ever occurs, larger values mix
+        # pairs of neighbouring lengths
+        self.batch_size = 2
+        self.scheduled_pairwise = False
+        self.adaptive_runs = False
+        self.runs_per_wave = 4
+        self.min_runs = 8
+        self.stopping_confidence = 0.95
+
         # CGNN
         self.h_layer_dim = 20
         self.train_epochs = 1000
@@ -39,6 +71,11 @@ class DefaultSettings(object):
         self.use_Fast_MMD = False
         self.nb_vectors_approx_MMD = 100
         self.complexity_graph_param = 0.00005
+        self.scheduling = 'sweep'
+        self.move_ordering = 'weight'
+        self.first_improvement = False
+        self.max_tries = None
+        self.init_mechanisms = False
 
 
 
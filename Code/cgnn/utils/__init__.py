@@ -1 +1,2 @@
-from .Formats import CCEPC_PairsFileReader
+from .Dataset import Dataset
+from .Formats import CCEPC_PairsFileIterator, CCEPC_PairsFileReader, read_numdata, read_pairs
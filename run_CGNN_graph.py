@@ -1,12 +1,14 @@
 import cgnn
 import sys
 import pandas as pd
+from cgnn.utils import Dataset, read_numdata
 
 # Params
 cgnn.SETTINGS.GPU = True
 cgnn.SETTINGS.NB_GPU = 2
 cgnn.SETTINGS.NB_JOBS = 8
 cgnn.SETTINGS.NB_RUNS = 32
+cgnn.enable_logging()  # Progress of the searches ; logging.DEBUG to follow the trainings
 
 
 datafile = "Example_graph_numdata.csv"
@@ -16,7 +18,8 @@ print("Processing " + datafile + "...")
 undirected_links = pd.read_csv(skeletonfile)
 
 umg = cgnn.UndirectedGraph(undirected_links)
-data = pd.read_csv(datafile)
+data = read_numdata(datafile)  # Binary cache datafile + '.cache', built at the first run
+data = Dataset.from_frame(data)  # Standardized once for GNN and CGNN
 
 GNN = cgnn.GNN(backend="TensorFlow")
 p_directed_graph = GNN.orient_graph(data, umg, printout=datafile + '_printout.csv')
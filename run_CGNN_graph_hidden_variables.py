@@ -1,23 +1,24 @@
 import cgnn
 import pandas as pd
-from sklearn.preprocessing import scale
+from cgnn.utils import Dataset, read_numdata
 
 # Params
 cgnn.SETTINGS.GPU = True
 cgnn.SETTINGS.NB_GPU = 2
 cgnn.SETTINGS.NB_JOBS = 8
 cgnn.SETTINGS.NB_RUNS = 32
+cgnn.enable_logging()  # Progress of the searches ; logging.DEBUG to follow the trainings
 
 datafile = "Example_graph_confounders_numdata.csv"
 skeletonfile = "Example_graph_confounders_skeleton.csv"
 
 
-data = pd.read_csv(datafile)
+data = read_numdata(datafile)  # Binary cache datafile + '.cache', built at the first run
 skeleton_links = pd.read_csv(skeletonfile)
 
 skeleton = cgnn.UndirectedGraph(skeleton_links)
 
-data = pd.DataFrame(scale(data),columns=data.columns)
+data = Dataset.from_frame(data)  # Standardized once for GNN and CGNN
 
 GNN = cgnn.GNN(backend="TensorFlow")
 p_directed_graph = GNN.orient_graph_confounders(data, skeleton, printout= datafile +  '_printout.csv')
@@ -1,5 +1,5 @@
 import cgnn
-from cgnn.utils import CCEPC_PairsFileReader as CC
+from cgnn.utils import read_pairs
 import pandas as pd
 
 # Params
@@ -15,11 +15,12 @@ cgnn.SETTINGS.h_layer_dim = 30
 #Setting for CGNN-MMD
 cgnn.SETTINGS.use_Fast_MMD = False
 cgnn.SETTINGS.NB_RUNS = 32
+cgnn.enable_logging()  # Progress of the searches ; logging.DEBUG to follow the trainings
 
 datafile = "Example_pairwise_pairs.csv"
 
 print("Processing " + datafile + "...")
-data = CC(datafile, scale=True)
+data = read_pairs(datafile)  # Binary cache datafile + '.cache', built at the first run ; pairs are scaled by the model
 model = cgnn.GNN(backend="TensorFlow")
 predictions = model.predict_dataset(data, printout=datafile + '_printout.csv')
 predictions = pd.DataFrame(predictions, columns=["Predictions"])